@@ -1,22 +1,35 @@
 # Description: Batch processing of videos. This class orchestrates the entire pipeline for a batch of videos.
 
+from concurrent.futures import ProcessPoolExecutor
 import json
+import multiprocessing
 import os 
+import threading
 import time 
-from typing import List, Dict 
+from typing import List, Dict, Optional 
 import cv2 
-import torch
 # import warnings
 import logging
 from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis 
-from document_wrapper_adamllryan.analysis.filter import Filter 
+from document_wrapper_adamllryan.analysis.extractive_summarizer import ExtractiveSummarizer 
+from document_wrapper_adamllryan.analysis.filter import Filter, ScoreRanking
 from document_wrapper_adamllryan.analysis.keyframe_extractor import KeyframeExtractor 
+from document_wrapper_adamllryan.analysis.model_residency import ModelResidency
+from document_wrapper_adamllryan.analysis.pipeline import Pipeline, PipelineStage
+from document_wrapper_adamllryan.analysis.sentence_index import SentenceIndex 
 from document_wrapper_adamllryan.analysis.sentence_scorer import SentenceScorer 
 from document_wrapper_adamllryan.analysis.splicer import Splicer 
 from document_wrapper_adamllryan.analysis.summarizer import Summarizer 
 from document_wrapper_adamllryan.analysis.transcriber import Transcriber 
 from document_wrapper_adamllryan.doc.document import Document 
 
+# Per-video stages that can run in worker processes, by their parallelism config key
+STAGE_METHODS = {
+    "keyframes": "get_or_generate_keyframes",
+    "filter": "filter_sentences",
+    "splice": "create_spliced_video",
+}
+
 class BatchExecutor:
     def __init__(self, video_ids: List[str], config: Dict[str, str]):
         self.config = config
@@ -24,12 +37,15 @@ class BatchExecutor:
         self.batch_size = config.get("batch_size", 1)
         self.documents: Dict[str, Document] = {}
         os.makedirs(self.config["output_dir"], exist_ok=True)
-        self.transcriber = None
-        self.summarizer = None
-        self.scorer = None
+        # The transcriber, summarizer and scorer stay loaded across batches while they fit the budget
+        self.models = ModelResidency(config.get("model_residency", {}))
         self.keyframe_extractor = None
         self.filterer = None
         self.splicer = None
+        self.sentence_index = None
+        self.parallelism: Dict[str, int] = config.get("parallelism", {})
+        self.stage_pools: Dict[str, ProcessPoolExecutor] = {}
+        self.stage_pools_lock = threading.Lock()  # Pipelined stages start their pools from several threads
 
         if config["suppress_torch"]:
             logging.getLogger("pytorch_lightning").setLevel(logging.ERROR)
@@ -40,6 +56,9 @@ class BatchExecutor:
             # warnings.simplefilter("ignore", category=UserWarning)
 
     def run(self):
+        if self.config.get("pipeline", {}).get("enabled", False):
+            return self.run_pipelined()
+
         total_videos = len(self.video_ids)
         print(f"Total videos: {total_videos}")
 
@@ -54,17 +73,7 @@ class BatchExecutor:
 
             # Check if we have partially completed batches
 
-            for video_id in batch:
-                doc_path = os.path.join(self.config["output_dir"], video_id, self.config["output_filename"])
-                if os.path.exists(doc_path):
-                    with open(doc_path, "r", encoding="utf-8") as f:
-                        transcript_data = json.load(f)
-                    # check metadata for error before loading
-                    if transcript_data["metadata"].get("error"):
-                        print(f"Error in document {video_id}: {transcript_data['metadata']['error']}")
-                        batch = [v for v in batch if v != video_id]
-                        continue
-                    self.documents[video_id] = DocumentAnalysis.list_to_document_from_processed(transcript_data["sentences"], transcript_data["metadata"])
+            batch = [video_id for video_id in batch if self._load_existing(video_id)]
 
             # Step 1: Transcription -> Creates Document objects
             for video_id in batch:
@@ -72,10 +81,6 @@ class BatchExecutor:
                     batch = [v for v in batch if v != video_id]
                     continue
                 self.get_or_generate_transcript(video_id)
-            if self.transcriber:
-                del self.transcriber
-                torch.cuda.empty_cache()
-                self.transcriber = None
 
             # Step 2: Summarization -> Updates Document objects
             for video_id in batch:
@@ -84,54 +89,25 @@ class BatchExecutor:
                     continue
                 if self.documents.get(video_id) and not self.documents[video_id].get_metadata("error"):
                     self.get_or_generate_summary(video_id)
-            if self.summarizer:
-                del self.summarizer
-                torch.cuda.empty_cache()
-                self.summarizer = None
 
             # Step 3: Sentence Scoring -> Updates Document objects
-            for video_id in batch:
-                if self.documents.get(video_id) and self.documents[video_id].get_metadata("error"):
-                    batch = [v for v in batch if v != video_id]
-                    continue
-                self.get_or_generate_sentence_scores(video_id)
-            if self.scorer:
-                del self.scorer
-                torch.cuda.empty_cache()
-                self.scorer = None
+            batch = [v for v in batch if not (self.documents.get(v) and self.documents[v].get_metadata("error"))]
+            self.get_or_generate_sentence_scores_many(batch)
 
             # Step 4: Keyframe Extraction -> Updates Document objects
-            for video_id in batch:
-                if self.documents.get(video_id) and self.documents[video_id].get_metadata("error"):
-                    batch = [v for v in batch if v != video_id]
-                    continue
-                self.get_or_generate_keyframes(video_id)
-            if self.keyframe_extractor:
-                del self.keyframe_extractor
-                torch.cuda.empty_cache()
-                self.keyframe_extractor = None
+            batch = [v for v in batch if not self._has_error(v)]
+            self.run_stage("keyframes", batch)
 
             # Step 5: Filtering -> Updates Document objects
-            for video_id in batch:
-                if self.documents.get(video_id) and self.documents[video_id].get_metadata("error"):
-                    batch = [v for v in batch if v != video_id]
-                    continue
-                self.filter_sentences(video_id)
-            if self.filterer:
-                del self.filterer
-                torch.cuda.empty_cache()
-                self.filterer = None
+            batch = [v for v in batch if not self._has_error(v)]
+            self.run_stage("filter", batch)
 
             # Step 6: Video Splicing
-            for video_id in batch:
-                if self.documents.get(video_id) and self.documents[video_id].get_metadata("error"):
-                    batch = [v for v in batch if v != video_id]
-                    continue
-                self.create_spliced_video(video_id)
-            if self.splicer:
-                del self.splicer
-                torch.cuda.empty_cache()
-                self.splicer = None
+            batch = [v for v in batch if not self._has_error(v)]
+            if self.parallelism.get("splice", 1) > 1:
+                self.run_stage("splice", batch)
+            else:
+                self.create_spliced_videos(batch)
 
             elapsed_time = time.time() - start_time
             print(f"Completed batch {batch_start + 1} to {batch_start + len(batch)} in {elapsed_time:.2f} seconds\n")
@@ -147,15 +123,141 @@ class BatchExecutor:
             print(f"Original video aggregate length: {original_length}")
             print(f"Final video aggregate length: {final_length}")
 
+        self.close_stage_pools()
+        self.models.clear()
 
 
 
+    def run_pipelined(self):
+        """
+        Runs the same six stages as run, but as a pipeline: each stage has its own worker threads and
+        hands videos to the next stage through a bounded queue, so one video's keyframes can be
+        extracted while the next is transcribed. Model stages run one at a time, and since they alternate
+        video by video their models all stay loaded unless model_residency sets a budget. CPU and ffmpeg
+        stages can have several workers.
+        """
+
+        pipeline_config = self.config["pipeline"]
+        workers = pipeline_config.get("workers", {})
+        print(f"Total videos: {len(self.video_ids)}, pipelined")
+
+        # Under a small budget every stage would evict the previous stage's model, once per video
+        if "memory_budget_mb" not in self.config.get("model_residency", {}):
+            self.models.budget = float("inf")
+
+        # The extractive summarizer and centroid prefilter use the scorer's model too
+        transcriber_lock, summarizer_lock, scorer_lock = threading.Lock(), threading.Lock(), threading.Lock()
+
+        pipeline = Pipeline([
+            PipelineStage("transcribe", lambda ids: self._for_each(ids, self.get_or_generate_transcript), locks=[transcriber_lock]),
+            PipelineStage("summarize", lambda ids: self._for_each(ids, self.get_or_generate_summary), locks=[summarizer_lock, scorer_lock]),
+            PipelineStage("score", lambda ids: self.get_or_generate_sentence_scores_many([v for v in ids if not self._has_error(v)]), batch=self.batch_size, locks=[scorer_lock]),
+            # With process parallelism each stage thread hands its video to the stage's process pool
+            PipelineStage("keyframes", lambda ids: self.run_stage("keyframes", ids), workers=max(workers.get("keyframes", 1), self.parallelism.get("keyframes", 1))),
+            PipelineStage("filter", lambda ids: self.run_stage("filter", ids), workers=max(workers.get("filter", 1), self.parallelism.get("filter", 1))),
+            PipelineStage("splice", lambda ids: self.run_stage("splice", ids), workers=max(workers.get("splice", 1), self.parallelism.get("splice", 1))),
+        ], pipeline_config.get("queue_size", 2))
+
+        video_ids = [video_id for video_id in self.video_ids if self._load_existing(video_id)]
+        failed = pipeline.run(video_ids)
+        self.close_stage_pools()
+        self.models.clear()
+
+        # Metrics display
+        original_length = 0
+        final_length = 0
+        for video_id in video_ids:
+            if video_id in failed or self._has_error(video_id):
+                continue
+            original_path = os.path.join(self.config["output_dir"], video_id, self.config["video_filename"])
+            final_path = os.path.join(self.config["output_dir"], video_id, self.config["spliced_video_filename"])
+            original_length += cv2.VideoCapture(original_path).get(cv2.CAP_PROP_FRAME_COUNT)
+            final_length += cv2.VideoCapture(final_path).get(cv2.CAP_PROP_FRAME_COUNT)
+
+        print(f"Original video aggregate length: {original_length}")
+        print(f"Final video aggregate length: {final_length}")
+
+    def run_stage(self, stage: str, video_ids: List[str]):
+        """
+        Runs a per-video stage ("keyframes", "filter" or "splice") on the videos without an error.
+
+        With parallelism[stage] above 1 the videos are spread over a process pool. Workers load each
+        document from its output.json and write it back, so only video ids cross process boundaries,
+        and the updated documents are reloaded here afterwards.
+        """
+
+        video_ids = [video_id for video_id in video_ids if not self._has_error(video_id)]
+        workers = self.parallelism.get(stage, 1)
+        if workers <= 1 or not video_ids:
+            self._for_each(video_ids, getattr(self, STAGE_METHODS[stage]))
+            return
+
+        with self.stage_pools_lock:
+            if stage not in self.stage_pools:
+                print(f"Starting {workers} worker processes for stage: {stage}")
+                # Spawned, forking while torch or OpenMP threads run can deadlock the children
+                self.stage_pools[stage] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            pool = self.stage_pools[stage]
+        list(pool.map(_run_stage_in_worker, [self.config] * len(video_ids), [stage] * len(video_ids), video_ids))
+
+        if stage != "splice":
+            for video_id in video_ids:
+                self._load_existing(video_id)
+
+    def close_stage_pools(self):
+        """Shuts down the worker processes of every stage."""
+        for pool in self.stage_pools.values():
+            pool.shutdown()
+        self.stage_pools = {}
+
+    def _for_each(self, video_ids: List[str], method):
+        """Calls a per-video stage method on every video without an error."""
+        for video_id in video_ids:
+            if not self._has_error(video_id):
+                method(video_id)
+
+    def _model(self, name: str):
+        """Borrows the transcriber, summarizer or scorer from the model residency, loading it if needed."""
+
+        loaders = {
+            "transcriber": lambda: Transcriber(self.config["transcriber"]),
+            "summarizer": lambda: Summarizer(self.config["summarizer"]),
+            "scorer": lambda: SentenceScorer(self.config["sentence_scorer"]),
+        }
+        return self.models.use(name, loaders[name])
+
+    def _has_error(self, video_id: str) -> bool:
+        return bool(self.documents.get(video_id) and self.documents[video_id].get_metadata("error"))
+
+    def _document_path(self, video_id: str) -> str:
+        """Where a video's Document is stored, every stage reads and writes it here."""
+        return os.path.join(self.config["output_dir"], video_id, self.config["output_filename"])
+
+    def _load_existing(self, video_id: str) -> bool:
+        """
+        Loads a partially processed video from its output file, if there is one.
+
+        Returns:
+            False if the stored document recorded an error, so the video should be skipped.
+        """
+
+        doc_path = self._document_path(video_id)
+        if os.path.exists(doc_path):
+            with open(doc_path, "r", encoding="utf-8") as f:
+                transcript_data = json.load(f)
+            # check metadata for error before loading
+            if transcript_data["metadata"].get("error"):
+                print(f"Error in document {video_id}: {transcript_data['metadata']['error']}")
+                return False
+            self.documents[video_id] = DocumentAnalysis.list_to_document_from_processed(transcript_data["sentences"], transcript_data["metadata"])
+        return True
+
     def get_or_generate_transcript(self, video_id: str):
         """
         Generates or retrieves a Document containing the transcript.
         """
 
-        output_path = os.path.join(self.config["output_dir"], video_id, "output.json")
+        output_path = self._document_path(video_id)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         # Check if transcript already exists
@@ -164,15 +266,12 @@ class BatchExecutor:
                 print(f"Transcript already exists for video: {video_id}, skipping.")
                 return
 
-        # Lazy load transcriber
-        if self.transcriber is None:
-            self.transcriber = Transcriber(self.config["transcriber"])
-
         # Generate transcript
         video_path = os.path.join(self.config["video_dir"], video_id, self.config["video_filename"])
         print(f"Generating new transcript for video: {video_id}")
 
-        self.documents[video_id] = self.transcriber.transcribe(video_path)
+        with self._model("transcriber") as transcriber:
+            self.documents[video_id] = transcriber.transcribe(video_path)
 
         # Write aggregated output.json
         with open(output_path, "w", encoding="utf-8") as f:
@@ -183,7 +282,7 @@ class BatchExecutor:
         Generates or retrieves a summary.
         """
 
-        output_path = os.path.join(self.config["output_dir"], video_id, "output.json")
+        output_path = self._document_path(video_id)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         # Check if summary already exists
@@ -191,14 +290,20 @@ class BatchExecutor:
             print(f"Summary already exists for video: {video_id}, skipping.")
             return
 
-        # Lazy load summarizer
-        if self.summarizer is None:
-            self.summarizer = Summarizer(self.config["summarizer"])
-
         # Generate summary
         print(f"Generating new summary for video: {video_id}")
-        document_text = "\n".join(str(s) for s in self.documents[video_id].sentences)
-        summary = self.summarizer.summarize(document_text)
+        if self.config["summarizer"].get("backend", "abstractive") == "extractive":
+            summary = self._generate_extractive_summary(video_id)
+        else:
+            prefilter = self.config["summarizer"].get("prefilter")
+            if prefilter:
+                sentences, scores = self._rank_sentences_for_summary(video_id, prefilter.get("method", "keywords"))
+                with self._model("summarizer") as summarizer:
+                    summary = summarizer.summarize_ranked(sentences, scores, prefilter.get("top_k"), prefilter.get("token_budget"))
+            else:
+                document_text = "\n".join(str(s) for s in self.documents[video_id].sentences)
+                with self._model("summarizer") as summarizer:
+                    summary = summarizer.summarize(document_text)
 
         # Store summary in Document metadata
         self.documents[video_id].add_metadata("summary", summary)
@@ -207,37 +312,105 @@ class BatchExecutor:
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(self.documents[video_id].export(), f, indent=4)
 
+    def _generate_extractive_summary(self, video_id: str) -> str:
+        """
+        Picks summary sentences from the sentence embeddings, skipping seq2seq generation.
+        """
+
+        with self._model("scorer") as scorer:
+            embeddings = scorer.embed(self.documents[video_id])
+        return ExtractiveSummarizer(self.config["summarizer"]).summarize(self.documents[video_id], embeddings)
+
+    def _rank_sentences_for_summary(self, video_id: str, method: str):
+        """
+        Cheaply scores the non-blank sentences so only the best ones are sent to the summarizer.
+        """
+
+        document = self.documents[video_id]
+        keep = [i for i, s in enumerate(document.sentences) if str(s).strip()]
+        sentences = [str(document.sentences[i]) for i in keep]
+
+        if method == "centroid":
+            with self._model("scorer") as scorer:
+                embeddings = scorer.embed(document)[keep]
+            scores = ExtractiveSummarizer({"method": "centroid"}).rank(embeddings)
+        elif method == "keywords":
+            scores = ExtractiveSummarizer.keyword_scores(sentences)
+        else:
+            raise ValueError(f"Unknown prefilter method: {method}")
+
+        return sentences, scores.tolist()
+
     def get_or_generate_sentence_scores(self, video_id: str):
         """
         Computes or loads sentence similarity scores.
         """
+        self.get_or_generate_sentence_scores_many([video_id])
 
-        output_path = os.path.join(self.config["output_dir"], video_id, "output.json")
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        # print("Text score: ", self.documents[video_id].call_track_method("get_embeddings", "text"))
-        # Check if scores and embeddings exist
-        if self.documents[video_id] and all(s["text"] is not None for s in self.documents[video_id].call_track_method("get_score", "text")) and all(len(s["text"]) > 0 for s in self.documents[video_id].call_track_method("get_embeddings", "text")):
-            print(f"Sentence scores already exist for video: {video_id}, skipping.")
-            return
+    def get_or_generate_sentence_scores_many(self, video_ids: List[str]):
+        """
+        Computes or loads sentence similarity scores, encoding all missing videos together.
+        """
 
-        # Lazy load scorer
-        if self.scorer is None:
-            self.scorer = SentenceScorer(self.config["sentence_scorer"])
+        pending = []
+        for video_id in video_ids:
+            # print("Text score: ", self.documents[video_id].call_track_method("get_embeddings", "text"))
+            # Check if scores and embeddings exist, blank sentences have no embeddings
+            document = self.documents[video_id]
+            scores = document.call_track_method("get_score", "text")
+            embeddings = document.call_track_method("get_embeddings", "text")
+            if all(s["text"] is not None for s in scores) and all(len(e["text"]) > 0 for e, sentence in zip(embeddings, document.sentences) if str(sentence).strip()):
+                print(f"Sentence scores already exist for video: {video_id}, skipping.")
+                continue
+            pending.append(video_id)
+
+        if pending:
+            self._generate_sentence_scores(pending)
+
+        if self.config.get("sentence_index"):
+            self.index_sentences(video_ids, replace=pending)
+
+    def _generate_sentence_scores(self, pending: List[str]):
+        """
+        Scores the given videos in a single pass and writes their documents.
+        """
 
         # Compute embeddings and sentence scores
-        print(f"Computing sentence embeddings and scores for video: {video_id}")
-        self.scorer.score(self.documents[video_id])
+        print(f"Computing sentence embeddings and scores for videos: {', '.join(pending)}")
+        with self._model("scorer") as scorer:
+            scorer.score_many([self.documents[video_id] for video_id in pending])
 
-        # Write aggregated output.json
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(self.documents[video_id].export(), f, indent=4)
+        for video_id in pending:
+            output_path = self._document_path(video_id)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+            # Write aggregated output.json
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(self.documents[video_id].export(), f, indent=4)
     
+    def index_sentences(self, video_ids: List[str], replace: Optional[List[str]] = None):
+        """
+        Adds the sentence embeddings of the given videos to the corpus-level sentence index.
+        Videos already in the index are only re-added if they are listed in replace.
+        """
+
+        # Lazy load index, it is kept for the whole run since adds are incremental
+        if self.sentence_index is None:
+            index_config = self.config["sentence_index"]
+            self.sentence_index = SentenceIndex(index_config["path"], index_config)
+
+        for video_id in video_ids:
+            if video_id in self.sentence_index and video_id not in (replace or []):
+                continue
+            count = self.sentence_index.add_document(video_id, self.documents[video_id])
+            print(f"Indexed {count} sentences for video: {video_id}")
+
     def get_or_generate_keyframes(self, video_id: str):
         """
         Computes or loads keyframe counts per sentence and updates the KeyframeTrack.
         """
 
-        output_path = os.path.join(self.config["output_dir"], video_id, "output.json")
+        output_path = self._document_path(video_id)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         if self.documents[video_id] and all(s["keyframe"] is not None for s in self.documents[video_id].call_track_method("get_score", "keyframe")):
@@ -262,7 +435,7 @@ class BatchExecutor:
         Filters sentences based on their scores and updates the Document metadata.
         """
 
-        output_path = os.path.join(self.config["output_dir"], video_id, "output.json")
+        output_path = self._document_path(video_id)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         # Check if filtering is already completed
@@ -286,32 +459,67 @@ class BatchExecutor:
             json.dump(self.documents[video_id].export(), f, indent=4)
 
 
+    def sweep_filter_thresholds(self, video_id: str, percentiles: List[float]) -> Dict[float, float]:
+        """
+        Reports the summary duration each threshold_percentile would give, from the scores stored by
+        filter_sentences, without refiltering or rewriting output.json.
+        """
+
+        ranking = ScoreRanking.from_document(self.documents[video_id])
+        durations = dict(zip(percentiles, ranking.sweep(percentiles, durations_only=True).tolist()))
+        for percentile, duration in durations.items():
+            print(f"{video_id}: threshold_percentile {percentile} -> {duration:.1f}s")
+        return durations
+
     def create_spliced_video(self, video_id: str):
         """
         Creates a spliced video based on the filtered sentences.
         """
 
+        job = self._splice_job(video_id)
+        if job:
+            # Perform splicing
+            print(f"Creating spliced video for video: {video_id}")
+            self.splicer.splice(*job)
+
+    def create_spliced_videos(self, video_ids: List[str]):
+        """
+        Creates the spliced videos of several videos, running their ffmpeg jobs in parallel.
+        """
+
+        jobs = [job for job in (self._splice_job(video_id) for video_id in video_ids) if job]
+        if jobs:
+            self.splicer.splice_many(jobs)
+
+    def _splice_job(self, video_id: str):
+        """Builds the (video_path, timestamps, output_path) splice job of a video, or None if there is nothing to do."""
+
         video_path = os.path.join(self.config["video_dir"], video_id, self.config["video_filename"])
         spliced_video_path = os.path.join(self.config["output_dir"], video_id, self.config["spliced_video_filename"])
 
         # Check if spliced video already exists
         if os.path.exists(spliced_video_path):
             print(f"Spliced video already exists for video: {video_id}, skipping.")
-            return
+            return None
 
         # Lazy load splicer
         if self.splicer is None:
             self.splicer = Splicer(self.config["splicer"])
 
-        # Get filtered sentences
-        filtered_sentences = [
-            s for s in self.documents[video_id].sentences
-            if s.call_track_method("get_score", "text") is not None
-        ]
+        # Get the ranges of the filtered sentences
+        filtered_sentences = self.documents[video_id].get_metadata("filtered_sentences")
+        if not filtered_sentences:
+            print(f"No filtered sentences for video: {video_id}, skipping.")
+            return None
+
+        # Merge neighbouring sentences so ffmpeg seeks once per run of them
+        timestamps = self.splicer.normalize(filtered_sentences)
+        return video_path, timestamps, spliced_video_path
 
-        # Extract timestamps from filtered sentences
-        timestamps = [(s.start, s.end) for s in filtered_sentences]
 
-        # Perform splicing
-        print(f"Creating spliced video for video: {video_id}")
-        self.splicer.splice(video_path, timestamps, spliced_video_path)
+def _run_stage_in_worker(config: Dict[str, str], stage: str, video_id: str) -> str:
+    """Worker process: runs one per-video stage on the document stored in the video's output.json."""
+    executor = BatchExecutor([video_id], config)
+    executor._load_existing(video_id)
+    getattr(executor, STAGE_METHODS[stage])(video_id)
+    return video_id
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import hashlib
+import json
+import os
+import unicodedata
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent LRU cache of sentence embeddings, stored as a memory-mapped vector file plus a hash index.
+    """
+    def __init__(self, path: str, model_name: str, dim: int, max_entries: int = 100000):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+
+        # Each model gets its own vector file since dimensions differ between models
+        self.path = os.path.join(path, model_name.replace("/", "__"))
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, "vectors.npy")
+        self.index_path = os.path.join(self.path, "index.json")
+
+        # Key -> slot in the vector file, ordered from least to most recently used
+        self.index: "OrderedDict[str, int]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Set when entries or their recency changed since the last flush
+        self.dirty = False
+
+        self._open()
+
+    def _open(self) -> None:
+        """Opens the vector file, starting a new cache if the stored one does not match."""
+
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("dim") == self.dim and stored.get("max_entries") == self.max_entries:
+                self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+                self.index = OrderedDict((key, slot) for key, slot in stored["entries"])
+                self.free = sorted(set(range(self.max_entries)) - set(self.index.values()), reverse=True)
+                return
+            print(f"Warning: Embedding cache at {self.path} does not match the current config, rebuilding.")
+
+        self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="w+", dtype=np.float32, shape=(self.max_entries, self.dim))
+        self.index = OrderedDict()
+        self.free = list(range(self.max_entries - 1, -1, -1))
+
+    def key(self, text: str) -> str:
+        """Hashes the model name together with the whitespace-normalized text."""
+
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha1(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Retrieves cached embeddings.
+
+        Returns:
+            An array with one row per text (zeros where missing) and the indices of the missing texts.
+        """
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+
+        for i, text in enumerate(texts):
+            key = self.key(text)
+            slot = self.index.get(key)
+            if slot is None:
+                missing.append(i)
+                self.misses += 1
+                continue
+            embeddings[i] = self.vectors[slot]
+            self.index.move_to_end(key)
+            self.hits += 1
+            self.dirty = True
+
+        return embeddings, missing
+
+    def store(self, texts: List[str], embeddings: np.ndarray) -> None:
+        """Adds embeddings to the cache, evicting the least recently used entries when full."""
+
+        assert len(texts) == len(embeddings), "Embeddings length must match the number of texts"
+
+        for text, embedding in zip(texts, embeddings):
+            key = self.key(text)
+            if key in self.index:
+                slot = self.index[key]
+                self.index.move_to_end(key)
+            elif self.free:
+                slot = self.free.pop()
+                self.index[key] = slot
+            else:
+                _, slot = self.index.popitem(last=False)
+                self.index[key] = slot
+                self.evictions += 1
+            self.vectors[slot] = embedding
+            self.dirty = True
+
+    def flush(self) -> None:
+        """Writes the vector file and the index to disk."""
+
+        self.vectors.flush()
+
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self.dim,
+                "max_entries": self.max_entries,
+                "entries": list(self.index.items()),
+            }, f)
+        os.replace(temp_path, self.index_path)
+        self.dirty = False
+
+    def stats(self) -> Dict[str, float]:
+        """Retrieves hit/miss statistics for this session."""
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
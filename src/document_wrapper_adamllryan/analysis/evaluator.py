@@ -1,16 +1,20 @@
-from typing import Dict, Any, List
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple
 import numpy as np
 from scipy.stats import kendalltau, spearmanr
 from rouge_score import rouge_scorer
 from sklearn.metrics import precision_recall_fscore_support
-from sentence_transformers import SentenceTransformer, util
+from document_wrapper_adamllryan.analysis.sentence_scorer import SentenceScorer
+from document_wrapper_adamllryan.doc.document import Document
 import csv
 
 class Evaluator:
     def __init__(self, config: Dict[str, Any]) -> None:
         self.config = config
+        # Only embedding similarity needs a model, so it is loaded on first use
+        self.model = None
 
-    def evaluate_tvsum(self, documents: Dict[str, Document], ground_truths: Dict[str, Any]) -> Dict[str, Any]):
+    def evaluate_tvsum(self, documents: Dict[str, Document], ground_truths: Dict[str, Any]) -> Dict[str, Any]:
         """
         Evaluates the performance of the document summarization system.
 
@@ -150,7 +154,7 @@ class Evaluator:
 
         return kendalltau(pred_scores, gt_scores).correlation, spearmanr(pred_scores, gt_scores).correlation
 
-        def _compute_fscore(self, pred_scores: List[float], gt_scores: List[float], threshold: int = 3) -> (float, float, float):
+    def _compute_fscore(self, pred_scores: List[float], gt_scores: List[float], threshold: int = 3) -> (float, float, float):
         """
         Computes Precision, Recall, and F-score.
 
@@ -203,10 +207,11 @@ class Evaluator:
         doc_text = " ".join([entry["text"]["text"] for entry in document.get_sentences()])
         gt_text = " ".join([entry["text"] for entry in ground_truth["sentences"]])
 
-        doc_embedding = self.model.encode(doc_text, convert_to_tensor=True)
-        gt_embedding = self.model.encode(gt_text, convert_to_tensor=True)
+        if self.model is None:
+            self.model = SentenceScorer.load_model(self.config)
+        doc_embedding, gt_embedding = self.model.encode([doc_text, gt_text])
 
-        return util.pytorch_cos_sim(doc_embedding, gt_embedding).item()
+        return float(np.dot(doc_embedding, gt_embedding) / max(np.linalg.norm(doc_embedding) * np.linalg.norm(gt_embedding), 1e-12))
 
     @staticmethod
     def load_tvsum_tsv(file_name: str) -> Dict[str, Any]:
@@ -0,0 +1,88 @@
+from typing import Dict, List
+import re
+import numpy as np
+from document_wrapper_adamllryan.doc.document import Document
+
+
+class ExtractiveSummarizer:
+    """
+    Summarizes transcripts by selecting the most central sentences using their embeddings.
+    """
+    def __init__(self, config: Dict[str, str]):
+        self.config = config
+        self.method = self.config.get("method", "textrank")
+
+        assert self.method in ("textrank", "centroid"), f"Unknown extractive method: {self.method}"
+
+        self.num_sentences = self.config.get("num_sentences", 5)
+        self.damping = self.config.get("damping", 0.85)
+        self.max_iter = self.config.get("max_iter", 100)
+        self.tolerance = self.config.get("tolerance", 1e-6)
+
+    def summarize(self, document: Document, embeddings: np.ndarray) -> str:
+        """Builds a summary from the highest ranked sentences, kept in their original order."""
+
+        texts = [str(s) for s in document.sentences]
+        assert len(texts) == len(embeddings), "Embeddings length must match the number of sentences"
+
+        # Blank gap sentences carry no content, leave them out of the ranking
+        keep = [i for i, text in enumerate(texts) if text.strip()]
+        if not keep:
+            return ""
+
+        scores = self.rank(np.asarray(embeddings, dtype=np.float32)[keep])
+        top = np.sort(np.argsort(-scores, kind="stable")[:self.num_sentences])
+
+        return " ".join(texts[keep[i]].strip() for i in top)
+
+    def rank(self, embeddings: np.ndarray) -> np.ndarray:
+        """Scores each embedding by how central it is to the whole set."""
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.maximum(norms, 1e-12)
+
+        if self.method == "centroid":
+            centroid = normalized.mean(axis=0)
+            return normalized @ (centroid / max(np.linalg.norm(centroid), 1e-12))
+
+        return self._textrank(normalized)
+
+    @staticmethod
+    def keyword_scores(texts: List[str], min_word_len: int = 4) -> np.ndarray:
+        """Scores each text by the average document frequency of its keywords, no model required."""
+
+        words = [[w for w in re.findall(r"\w+", text.lower()) if len(w) >= min_word_len] for text in texts]
+
+        vocabulary: Dict[str, int] = {}
+        ids = np.fromiter((vocabulary.setdefault(w, len(vocabulary)) for ws in words for w in ws), dtype=np.int64)
+        if ids.size == 0:
+            return np.zeros(len(texts))
+
+        # Weight every word occurrence by how often the word appears across the transcript
+        counts = np.bincount(ids)
+        owners = np.repeat(np.arange(len(texts)), [len(ws) for ws in words])
+        totals = np.bincount(owners, weights=counts[ids], minlength=len(texts))
+        lengths = np.array([len(ws) for ws in words])
+
+        return totals / np.maximum(lengths, 1)
+
+    def _textrank(self, normalized: np.ndarray) -> np.ndarray:
+        """Runs PageRank over the cosine similarity graph of the sentences."""
+
+        n = normalized.shape[0]
+        similarity = np.clip(normalized @ normalized.T, 0.0, None)
+        np.fill_diagonal(similarity, 0.0)
+
+        # Row-normalize into a transition matrix, isolated sentences jump uniformly
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        transition = np.where(row_sums > 0, similarity / np.maximum(row_sums, 1e-12), 1.0 / n)
+
+        ranks = np.full(n, 1.0 / n)
+        for _ in range(self.max_iter):
+            updated = (1 - self.damping) / n + self.damping * (transition.T @ ranks)
+            if np.abs(updated - ranks).sum() < self.tolerance:
+                ranks = updated
+                break
+            ranks = updated
+
+        return ranks
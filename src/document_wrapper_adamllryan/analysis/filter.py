@@ -1,16 +1,22 @@
-
-from typing import List
-import numpy as np 
+from typing import Dict, List, Sequence, Union
+import numpy as np
 from document_wrapper_adamllryan.doc.document import Document
 
+# How each track's scores are normalized before weighting, text scores are already cosine similarities
+DEFAULT_NORMALIZATION = {"text": "none", "keyframe": "minmax"}
+
 
 class Filter:
     """
     Filters sentences in a Document based on a dynamically computed threshold from the score distribution.
+
+    Scores are held in arrays aligned with document.sentences, so sentences sharing a timestamp stay separate.
     """
 
     def __init__(self, config: dict):
         self.config = config
+        self.weights: Dict[str, float] = self.config.get("weights", {"text": 1.0, "keyframe": 1.0})
+        self.normalization: Dict[str, str] = {**DEFAULT_NORMALIZATION, **self.config.get("normalization", {})}
 
     def apply(self, document: Document, threshold: float = None):
         """
@@ -23,51 +29,195 @@ class Filter:
 
         print("Filtering sentences")
 
-        # Extract scores from text track
-        text_scores = {
-            tuple(sentence.timestamp): sentence.call_track_method("get_score", "text")["text"]
-            for sentence in document.sentences
-            if sentence.call_track_method("get_score", "text") is not None
-        }
+        scores = self.combine(document)
 
-        # Extract scores from keyframe track
-        keyframe_scores = {
-            tuple(sentence.timestamp): sentence.call_track_method("get_score", "keyframe")["keyframe"]
-            for sentence in document.sentences
-            if sentence.call_track_method("get_score", "keyframe") is not None
-        }
+        selection = self.config.get("selection", "percentile")
+        if selection == "duration":
+            selected = self.select_by_duration(document, scores)
+        else:
+            assert selection == "percentile", f"Unknown selection mode: {selection}"
 
-        # Normalize keyframe scores to [0, 1]
-        if keyframe_scores:
-            max_score = max(keyframe_scores.values())
-            min_score = min(keyframe_scores.values())
+            ranking = ScoreRanking(scores, document)
 
-            if min_score == max_score:
-                keyframe_scores = {timestamp: (1 if max_score == 0 else 0) for timestamp in keyframe_scores}
-            else: 
-                for timestamp in keyframe_scores:
-                    keyframe_scores[timestamp] = (keyframe_scores[timestamp] - min_score) / (max_score - min_score)
+            # Compute threshold dynamically if not provided
+            if threshold is None:
+                threshold = ranking.threshold(self.config.get("threshold_percentile", 80))
+                print(f"Computed threshold: {threshold}")
 
-        # Combine scores 
+            # Select sentences that meet the threshold
+            selected = ranking.select_threshold(threshold)
 
-        scores = {timestamp: text_scores.get(timestamp, 0) + keyframe_scores.get(timestamp, 0) for timestamp in text_scores}
+        print(f"Filtered {len(selected)} sentences out of {len(document.sentences)}")
 
-        all_scores = list(scores.values())
+        # Store filtered sentences in Document metadata
+        document.add_metadata("filtered_sentences", [tuple(document.sentences[i].timestamp) for i in selected])
 
-        # Compute threshold dynamically if not provided
-        if threshold is None:
-            threshold = np.percentile(all_scores, self.config.get("threshold_percentile", 80))
-            print(f"Computed threshold: {threshold}")
+        # update document sentence scores
 
-        # Select sentences that meet the threshold
-        filtered_sentences = [
-            timestamp for timestamp, score in scores.items() if score >= threshold
-        ]
-        print(f"Filtered {len(filtered_sentences)} sentences out of {len(document.sentences)}")
+        document.set_scores(scores.tolist())
 
-        # Store filtered sentences in Document metadata
-        document.add_metadata("filtered_sentences", filtered_sentences)
+    def rank(self, document: Document) -> "ScoreRanking":
+        """Combines the track scores once and ranks them, for trying many thresholds without refiltering."""
+        return ScoreRanking(self.combine(document), document)
+
+    def select_by_duration(self, document: Document, scores: np.ndarray) -> np.ndarray:
+        """
+        Selects the sentences with the highest total score that fit in a time budget.
+
+        The budget is target_duration seconds, or compression_ratio of the document's total duration.
+        Up to knapsack_max_n sentences are solved exactly, larger documents greedily by score per second.
+
+        Returns:
+            The selected sentence indices in time order.
+        """
+
+        durations = np.array([sentence.end - sentence.start for sentence in document.sentences], dtype=np.float64)
+        if "target_duration" in self.config:
+            budget = float(self.config["target_duration"])
+        else:
+            budget = float(durations.sum() * self.config.get("compression_ratio", 0.2))
+
+        if len(scores) <= self.config.get("knapsack_max_n", 200):
+            selected = self._knapsack(scores, durations, budget, self.config.get("knapsack_resolution", 0.1))
+        else:
+            selected = self._greedy(scores, durations, budget)
+
+        print(f"Selected {durations[selected].sum():.1f}s of {durations.sum():.1f}s with a {budget:.1f}s budget")
+        return selected
+
+    @staticmethod
+    def _greedy(scores: np.ndarray, durations: np.ndarray, budget: float) -> np.ndarray:
+        """Takes sentences by descending score per second, skipping any that no longer fit."""
+
+        # Zero-length sentences cost nothing and come first
+        density = np.divide(scores, durations, out=np.full_like(scores, np.inf), where=durations > 0)
+        order = np.argsort(-density, kind="stable")
+        order = order[scores[order] > 0]
+
+        # The running total only grows, so everything before the first overflow fits as is
+        fits = np.cumsum(durations[order]) <= budget
+        cut = len(order) if fits.all() else int(np.argmin(fits))
+        selected, used = list(order[:cut]), durations[order[:cut]].sum()
+
+        for i in order[cut:]:
+            if used + durations[i] <= budget:
+                selected.append(i)
+                used += durations[i]
+
+        return np.sort(np.array(selected, dtype=np.int64))
+
+    @staticmethod
+    def _knapsack(scores: np.ndarray, durations: np.ndarray, budget: float, resolution: float) -> np.ndarray:
+        """Solves the 0/1 knapsack exactly, with durations rounded up to the resolution in seconds."""
+
+        capacity = int(budget / resolution)
+        weights = np.ceil(durations / resolution - 1e-9).astype(np.int64)
+        candidates = np.flatnonzero((scores > 0) & (weights <= capacity))
+
+        best = np.zeros(capacity + 1)
+        taken = np.zeros((len(candidates), capacity + 1), dtype=bool)
+        for row, i in enumerate(candidates):
+            w = weights[i]
+            with_item = np.full(capacity + 1, -np.inf)
+            with_item[w:] = best[:capacity + 1 - w] + scores[i]
+            taken[row] = with_item > best
+            best = np.maximum(best, with_item)
+
+        # Walk back from the full capacity to recover the chosen sentences
+        selected, remaining = [], capacity
+        for row in range(len(candidates) - 1, -1, -1):
+            if taken[row, remaining]:
+                selected.append(candidates[row])
+                remaining -= weights[candidates[row]]
+
+        return np.sort(np.array(selected, dtype=np.int64))
+
+    def combine(self, document: Document) -> np.ndarray:
+        """Computes the weighted sum of the normalized track scores, one per sentence."""
+
+        scores = np.zeros(len(document.sentences))
+        for track, weight in self.weights.items():
+            scores += weight * self.normalize(self.track_scores(document, track), self.normalization.get(track, "none"))
+        return scores
+
+    @staticmethod
+    def track_scores(document: Document, track: str) -> np.ndarray:
+        """Collects one track's scores in sentence order, missing scores count as 0."""
+
+        # Reading the tracks directly skips building a result dict per sentence
+        tracks = [sentence.get_track(track) for sentence in document.sentences]
+        return np.array([0.0 if t is None or t.get_score() is None else t.get_score() for t in tracks], dtype=np.float64)
+
+    @staticmethod
+    def normalize(scores: np.ndarray, method: str) -> np.ndarray:
+        """
+        Normalizes scores with "none", "minmax" to [0, 1] or "zscore".
+
+        When every score is equal, minmax gives 1 if they are all 0 and 0 otherwise, and zscore gives 0.
+        """
+
+        if method == "none" or len(scores) == 0:
+            return scores
+
+        low, high = scores.min(), scores.max()
+        if method == "minmax":
+            if low == high:
+                return np.full_like(scores, 1.0 if high == 0 else 0.0)
+            return (scores - low) / (high - low)
+
+        if method == "zscore":
+            std = scores.std()
+            return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
 
-        # update document sentence scores 
+        raise ValueError(f"Unknown normalization method: {method}")
+
+
+class ScoreRanking:
+    """
+    Sentences sorted by combined score, with running totals of their durations.
+
+    After one O(N log N) sort, every percentile threshold is a binary search, so sweeping many
+    thresholds needs no refiltering. Selections match Filter.apply with the same percentile.
+    """
+
+    def __init__(self, scores: np.ndarray, document: Document):
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.timestamps = [tuple(sentence.timestamp) for sentence in document.sentences]
+        self.durations = np.array([sentence.end - sentence.start for sentence in document.sentences], dtype=np.float64)
+
+        self.order = np.argsort(-self.scores, kind="stable")
+        self.descending = self.scores[self.order]
+        self.cumulative = np.concatenate([[0.0], np.cumsum(self.durations[self.order])])
+
+    @classmethod
+    def from_document(cls, document: Document) -> "ScoreRanking":
+        """Ranks the combined scores Filter.apply already stored on the sentences."""
+        return cls(np.array([sentence.get_score() for sentence in document.sentences], dtype=np.float64), document)
+
+    def threshold(self, percentiles: Union[float, Sequence[float]]) -> Union[float, np.ndarray]:
+        return np.percentile(self.scores, percentiles)
+
+    def _counts(self, thresholds: np.ndarray) -> np.ndarray:
+        """Number of sentences scoring at least each threshold."""
+        return np.searchsorted(-self.descending, -np.asarray(thresholds), side="right")
+
+    def select_threshold(self, threshold: float) -> np.ndarray:
+        """Indices of the sentences scoring at least the threshold, in time order."""
+        return np.sort(self.order[:int(self._counts(threshold))])
+
+    def select(self, percentile: float) -> List[tuple]:
+        """Timestamps of the sentences at or above the score percentile, as Filter.apply stores them."""
+        return [self.timestamps[i] for i in self.select_threshold(self.threshold(percentile))]
+
+    def sweep(self, percentiles: Sequence[float], durations_only: bool = False) -> Union[np.ndarray, List[List[tuple]]]:
+        """
+        Evaluates many percentile thresholds at once.
+
+        Returns:
+            The total duration selected at each percentile if durations_only, otherwise the selections.
+        """
 
-        document.set_scores(scores.values())
+        counts = self._counts(self.threshold(percentiles))
+        if durations_only:
+            return self.cumulative[counts]
+        return [[self.timestamps[i] for i in np.sort(self.order[:count])] for count in counts]
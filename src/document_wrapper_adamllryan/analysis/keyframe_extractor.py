@@ -1,11 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
 from typing import Dict, List
 import cv2
-import random
+import hashlib
+import json
+import os
+import subprocess
 import numpy as np 
-from sklearn.cluster import KMeans 
+from sklearn.cluster import KMeans, MiniBatchKMeans 
 from datetime import timedelta
+from document_wrapper_adamllryan.analysis.keyframe_features import extract_features
+from document_wrapper_adamllryan.analysis.scene_change import SceneChangeDetector
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
 from document_wrapper_adamllryan.doc.document import Document
 
+# Size of one compressed 50x50 BGR crop
+FEATURE_BYTES = 50 * 50 * 3
+
+# Settings that change which crops are sampled, and so key the feature cache
+SAMPLING_KEYS = ("sampling", "skip_frames", "sample_interval_s", "sample_width", "keyframes_only", "crop_size", "seed")
+
 class KeyframeExtractor:
     """
     Extracts keyframes from a video and assigns them to sentences based on timestamps.
@@ -16,6 +30,12 @@ class KeyframeExtractor:
     def extract(self, video_path: str, document: Document):
         """Extracts keyframes from the video and assigns them to sentences in the document."""
         # video_path = document.metadata.get("video_path", "")
+        scorer = self.config.get("scorer", "clusters")
+        if scorer == "scene_change":
+            self._score_scene_changes(video_path, document)
+            return
+        assert scorer == "clusters", f"Unknown keyframe scorer: {scorer}"
+
         print("Extracting keyframes")
         keyframes = self._extract_keyframes(video_path)
         
@@ -26,85 +46,479 @@ class KeyframeExtractor:
         keyframe_counts = self._assign_keyframes_to_sentences(keyframes, document)
         document.call_track_method("set_score", "keyframe", keyframe_counts)
     
+    def _score_scene_changes(self, video_path: str, document: Document):
+        """Scores each sentence by the summed visual change between the frames sampled inside it."""
+        print("Detecting scene changes")
+        detector = SceneChangeDetector(self.config)
+        scene_decoder = self.config.get("scene_decoder", "ffmpeg")
+        assert scene_decoder in ("ffmpeg", "sampler"), f"Unknown scene change decoder: {scene_decoder}"
+        if scene_decoder == "ffmpeg":
+            # ffmpeg scales and converts to grayscale while decoding, full frames never reach Python
+            samples = self._ffmpeg_frames(video_path, size=(detector.width, detector.height), gray=True)
+        else:
+            samples = self._sample_frames(video_path)
+        timestamps, changes = detector.detect(samples)
+
+        if len(changes) == 0:
+            print("Warning: Fewer than two frames read. This may indicate a cv2 error or an unreadable video file.")
+            return
+
+        # Changes below the threshold are treated as noise
+        significant = changes >= self.config.get("scene_threshold", 0.0)
+        print(f"Compared {len(changes) + 1} frames, {int(significant.sum())} changes above threshold")
+        scores = DocumentAnalysis.event_histogram(document, timestamps[significant], weights=changes[significant])
+        document.call_track_method("set_score", "keyframe", scores.tolist())
+
     def _extract_keyframes(self, video_path: str):
-        """Extracts keyframes from the video using frame skipping and clustering."""
+        """Extracts keyframes from the video using frame sampling and clustering."""
+        n_clusters = self.config["n_clusters"]
+
+        if self.config.get("online", False):
+            rng = self._video_rng(video_path)
+            return self._cluster_online(self._crop_blocks(self._sample_frames(video_path), lambda n: rng.random((n, 2))), n_clusters)
+
+        frames, timestamps = self._load_crops(video_path)
+
+        if len(frames) == 0:
+            print("Warning: No frames read from video. Exiting keyframe extraction.")
+            return []
+
+        print(f"Extracted {len(frames)} keyframes")
+        return self._cluster_keyframes(frames, timestamps, n_clusters)
+
+    def _load_crops(self, video_path: str):
+        """
+        Samples and crops the video, or loads the crops from the feature cache when it holds them.
+        Crops depend only on the video and the sampling settings, so clustering can be re-run freely.
+        """
+        cache_path = self._cache_path(video_path) if self.config.get("feature_cache") else None
+        if cache_path and os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                print(f"Loaded cached keyframe crops from {cache_path}")
+                return cached["frames"], cached["timestamps"]
+
+        rng = self._video_rng(video_path)
+        if self.config.get("workers", 1) > 1 and self.config.get("sampling", "grab") != "ffmpeg":
+            frames, timestamps = self._sample_parallel(video_path, self.config["workers"], rng)
+        else:
+            frames, timestamps = self._collect_crops(self._crop_blocks(self._sample_frames(video_path), lambda n: rng.random((n, 2))))
+
+        if cache_path and len(frames) > 0:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write to a temporary name first so an interrupted run never leaves a truncated cache entry
+            temporary_path = cache_path[:-len(".npz")] + ".tmp.npz"
+            np.savez_compressed(temporary_path, frames=frames, timestamps=timestamps)
+            os.replace(temporary_path, cache_path)
+        return frames, timestamps
+
+    def _cache_path(self, video_path: str) -> str:
+        """Cache file for a video, keyed by a partial hash of the file and the sampling settings."""
+        settings = {key: self.config.get(key) for key in SAMPLING_KEYS}
+        digest = hashlib.sha1(_video_fingerprint(video_path).encode("utf-8"))
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return os.path.join(self.config["feature_cache"], f"{digest.hexdigest()}.npz")
+
+    def _collect_crops(self, blocks):
+        """
+        Gathers blocks of crops from _crop_blocks into one chunk-grown (N, 50, 50, 3) array.
+
+        Returns:
+            The crops and a matching array of timestamps.
+        """
+        frames = np.empty((256, 50, 50, 3), dtype=np.uint8)
+        timestamps = np.empty(256)
+        count = 0
+
+        for crops, crop_timestamps in blocks:
+            while count + len(crops) > len(frames):
+                # Double the capacity so growing stays amortised O(1) per sample
+                frames = np.concatenate([frames, np.empty_like(frames)])
+                timestamps = np.concatenate([timestamps, np.empty_like(timestamps)])
+            frames[count:count + len(crops)] = crops
+            timestamps[count:count + len(crops)] = crop_timestamps
+            count += len(crops)
+
+        return frames[:count], timestamps[:count]
+
+    def _video_rng(self, video_path: str) -> np.random.Generator:
+        """Random generator for crop positions, seeded by the config seed and the video so reruns give identical crops."""
+        return np.random.default_rng([self.config.get("seed", 0), int(_video_fingerprint(video_path)[:16], 16)])
+
+    def _crop_blocks(self, samples, draw):
+        """
+        Cuts each sampled frame's crop window as it arrives and downsamples crop_block windows at once.
+
+        Only the small windows are copied, full frames are dropped as soon as they are cropped.
+
+        Args:
+            samples: (frame, timestamp) pairs, all frames the same size.
+            draw: Returns up to n uniform [0, 1) crop positions, an (n, 2) array, for the next n frames.
+
+        Yields:
+            (crops, timestamps) arrays per block.
+        """
+        block_size = self.config.get("crop_block", 32)
+        windows, positions, timestamps = None, None, []
+        for frame, timestamp in samples:
+            if not timestamps:
+                # Positions for a whole block at once, the first n rows match drawing n
+                positions = draw(block_size)
+            if windows is None:
+                h, w = frame.shape[:2]
+                crop_h, crop_w = min(self.config["crop_size"][0], h), min(self.config["crop_size"][1], w)
+                windows = np.empty((block_size, crop_h, crop_w, 3), dtype=np.uint8)
+
+            i = len(timestamps)
+            y = int(positions[i, 0] * (h - crop_h + 1))
+            x = int(positions[i, 1] * (w - crop_w + 1))
+            windows[i] = frame[y:y + crop_h, x:x + crop_w]
+            timestamps.append(timestamp)
+
+            if len(timestamps) == block_size:
+                yield self._downsample_crops(windows), np.array(timestamps)
+                timestamps = []
+        if timestamps:
+            yield self._downsample_crops(windows[:len(timestamps)]), np.array(timestamps)
+
+    @staticmethod
+    def _downsample_crops(windows: np.ndarray) -> np.ndarray:
+        """
+        Compresses an (N, crop_h, crop_w, 3) block of crop windows to 50x50 with nearest-neighbour
+        sampling, all in one fancy-indexing gather.
+        """
+        _, crop_h, crop_w, _ = windows.shape
+
+        # Centre of each of the 50 output pixels within the crop
+        rows = (2 * np.arange(50) + 1) * crop_h // 100
+        cols = (2 * np.arange(50) + 1) * crop_w // 100
+        return windows[:, rows[:, None], cols[None, :]]
+
+    def _sample_frames(self, video_path: str):
+        """
+        Yields (frame, timestamp) pairs using the configured sampling mode.
+
+        "grab" decodes every frame and keeps one every skip_frames. "seek" jumps straight to each
+        sample time, which is cheaper for sparse sampling. "ffmpeg" lets ffmpeg pick frames at the
+        sample interval and downscale them before they reach Python.
+        """
+        sampling = self.config.get("sampling", "grab")
+        if sampling == "grab":
+            yield from self._grab_frames(video_path)
+        elif sampling == "seek":
+            yield from self._seek_frames(video_path)
+        elif sampling == "ffmpeg":
+            yield from self._ffmpeg_frames(video_path)
+        else:
+            raise ValueError(f"Unknown sampling mode: {sampling}")
+
+    def _sample_interval(self, fps: float) -> float:
+        """Seconds between samples, derived from skip_frames if no interval is configured."""
+        if "sample_interval_s" in self.config:
+            return self.config["sample_interval_s"]
+        return (self.config["skip_frames"] + 1) / fps
+
+    def _open_video(self, video_path: str):
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             print(f"Error: Could not open video {video_path}")
-            return []
-        
+            return None
+        return cap
+
+    def _grab_frames(self, video_path: str):
+        """Reads frames sequentially, grabbing (but not retrieving) the skipped ones."""
+        cap = self._open_video(video_path)
+        if cap is None:
+            return
+
         fps = cap.get(cv2.CAP_PROP_FPS)
         skip_frames = self.config["skip_frames"]
-        crop_size = self.config["crop_size"]
-        n_clusters = self.config["n_clusters"]
         start_time = timedelta(seconds=0)
-        keyframes = []
         frame_id = 0
-        
+
         success, frame = cap.read()
-        if not success:
-            print("Warning: No frames read from video. Exiting keyframe extraction.")
-            cap.release()
-            return []
-        
         while success:
             timestamp = start_time + timedelta(seconds=frame_id / fps)
-            h, w, _ = frame.shape
-            crop_h, crop_w = crop_size
-            x, y = random.randint(0, w - crop_w), random.randint(0, h - crop_h)
-            cropped_frame = frame[y:y + crop_h, x:x + crop_w]
-            compressed_frame = cv2.resize(cropped_frame, (50, 50))
-            keyframes.append((compressed_frame, timestamp.total_seconds()))
-            
+            yield frame, timestamp.total_seconds()
+
             frame_id += 1
             for _ in range(skip_frames):
                 success = cap.grab()
                 if not success:
                     break
                 frame_id += 1
-            
+
             success, frame = cap.read()
         cap.release()
-        
-        print(f"Extracted {len(keyframes)} keyframes")
-        return self._cluster_keyframes(keyframes, n_clusters)
+
+    def _seek_frames(self, video_path: str):
+        """Seeks directly to each sample time, skipped frames are never decoded."""
+        cap = self._open_video(video_path)
+        if cap is None:
+            return
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+        cap.release()
+
+        yield from self._frames_at(video_path, np.arange(0, duration, self._sample_interval(fps)), seek_each=True)
+
+    def _frames_at(self, video_path: str, times: np.ndarray, seek_each: bool):
+        """
+        Yields the frames at the given sorted times, stopping at the first unreadable one.
+
+        With seek_each every sample is a seek. Otherwise only the first sample is a seek and the
+        capture grabs forward from there, which is cheaper when samples are close together.
+        """
+        cap = self._open_video(video_path)
+        if cap is None or len(times) == 0:
+            return
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.set(cv2.CAP_PROP_POS_MSEC, times[0] * 1000)
+        position = int(round(times[0] * fps))
+
+        for timestamp in times:
+            target = int(round(timestamp * fps))
+            if seek_each:
+                cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            else:
+                for _ in range(target - position):
+                    if not cap.grab():
+                        break
+            success, frame = cap.read()
+            if not success:
+                break
+            position = target + 1
+            yield frame, float(timestamp)
+        cap.release()
+
+    def _sample_parallel(self, video_path: str, workers: int, rng: np.random.Generator):
+        """
+        Splits the video into one time range per worker process and samples the ranges in parallel.
+        Workers write their 50x50 crops into shared memory so frames are never pickled.
+
+        Crop positions are drawn here for every sample time and split with the times, so the crops
+        match sequential sampling with the same generator.
+        """
+        empty = np.empty((0, 50, 50, 3), dtype=np.uint8), np.empty(0)
+        cap = self._open_video(video_path)
+        if cap is None:
+            return empty
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+        cap.release()
+
+        times = np.arange(0, duration, self._sample_interval(fps))
+        positions = np.array_split(rng.random((len(times), 2)), workers)
+        segments = [segment for segment in np.array_split(times, workers) if len(segment)]
+        if not segments:
+            return empty
+        print(f"Sampling {len(times)} frames in {len(segments)} segments")
+
+        blocks = [shared_memory.SharedMemory(create=True, size=len(segment) * FEATURE_BYTES) for segment in segments]
+        try:
+            # Spawned, this can run in a pipeline thread while other threads use torch or OpenMP
+            with ProcessPoolExecutor(max_workers=len(segments), mp_context=get_context("spawn")) as pool:
+                counts = list(pool.map(
+                    _sample_segment,
+                    [self.config] * len(segments),
+                    [video_path] * len(segments),
+                    segments,
+                    positions[:len(segments)],
+                    [block.name for block in blocks]
+                ))
+
+            frames = np.concatenate([
+                np.ndarray((len(segment), 50, 50, 3), dtype=np.uint8, buffer=block.buf)[:count]
+                for block, segment, count in zip(blocks, segments, counts)
+            ])
+            timestamps = np.concatenate([segment[:count] for segment, count in zip(segments, counts)])
+            return frames, timestamps
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def _ffmpeg_frames(self, video_path: str, size=None, gray: bool = False):
+        """
+        Pipes frames from ffmpeg, which selects one per interval and downscales them.
+
+        Frames are sample_width wide with the source aspect ratio unless a (width, height) size is
+        given, and (H, W) grayscale instead of BGR if gray.
+        """
+        cap = self._open_video(video_path)
+        if cap is None:
+            return
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        source_w, source_h = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        cap.release()
+
+        interval = self._sample_interval(fps)
+        if size:
+            width, height = size
+        else:
+            width = int(self.config.get("sample_width", 320))
+            height = max(2, int(round(source_h * width / source_w / 2)) * 2)
+        channels = 1 if gray else 3
+
+        command = ["ffmpeg", "-v", "error"]
+        if self.config.get("keyframes_only", False):
+            # Only decode keyframes, the fps filter repeats them to fill the interval grid
+            command += ["-skip_frame", "nokey"]
+        command += [
+            "-i", video_path,
+            # Area averaging keeps tiny scene change thumbnails from aliasing
+            "-vf", f"fps=1/{interval},scale={width}:{height}" + (":flags=area" if gray else ""),
+            "-f", "rawvideo", "-pix_fmt", "gray" if gray else "bgr24", "pipe:1"
+        ]
+
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        frame_bytes = width * height * channels
+        index = 0
+        try:
+            while True:
+                buffer = process.stdout.read(frame_bytes)
+                if len(buffer) < frame_bytes:
+                    break
+                frame = np.frombuffer(buffer, dtype=np.uint8)
+                yield frame.reshape(height, width) if gray else frame.reshape(height, width, 3), index * interval
+                index += 1
+        finally:
+            process.stdout.close()
+            process.wait()
     
-    def _cluster_keyframes(self, keyframes, n_clusters: int):
+    def _cluster_keyframes(self, frames: np.ndarray, timestamps: np.ndarray, n_clusters: int):
         """Clusters keyframes to find the most representative ones."""
         print("Clustering keyframes")
-        if not keyframes:
+        if len(frames) == 0:
             print("Warning: No keyframes available for clustering.")
             return []
         
-        keyframes_array = np.array([kf[0].flatten() for kf in keyframes])
-        timestamps = [kf[1] for kf in keyframes]
-        n_clusters = min(len(keyframes) // 2, n_clusters)
+        n_clusters = min(len(frames) // 2, n_clusters)
         if n_clusters == 0:
             print("Warning: Not enough keyframes for clustering.")
             return []
         
-        kmeans = KMeans(n_clusters=n_clusters, random_state=0)
-        kmeans.fit(keyframes_array)
-        labels = kmeans.labels_
-        cluster_centers = kmeans.cluster_centers_
+        features = extract_features(frames, self.config)
+        clustering = self._create_clustering(n_clusters)
+        clustering.fit(features)
+        labels = clustering.labels_
+        cluster_centers = clustering.cluster_centers_
         
         representative_keyframes = []
         for cluster in range(n_clusters):
             cluster_indices = np.where(labels == cluster)[0]
             if cluster_indices.size > 0:
-                distances = np.linalg.norm(keyframes_array[cluster_indices] - cluster_centers[cluster], axis=1)
+                distances = np.linalg.norm(features[cluster_indices] - cluster_centers[cluster], axis=1)
                 closest_index = cluster_indices[np.argmin(distances)]
-                representative_keyframes.append({"frame": keyframes_array[closest_index].reshape(50, 50, 3),
-                                                 "timestamp": timestamps[closest_index]})
+                representative_keyframes.append({"frame": frames[closest_index].copy(),
+                                                 "timestamp": float(timestamps[closest_index])})
+        return representative_keyframes
+
+    def _cluster_online(self, blocks, n_clusters: int):
+        """
+        Clusters sampled frames block by block with MiniBatchKMeans.partial_fit, so memory stays
+        constant however long the video is. Only one block of crops plus the candidates_per_cluster
+        nearest crops of each cluster are kept. The final representatives are picked from those
+        candidates against the final cluster centres.
+        """
+        assert self.config.get("features", "raw") != "pca", "PCA features need every frame and cannot be used online"
+        block_size = max(self.config.get("minibatch_size", 1024), 2 * n_clusters)
+        keep = self.config.get("candidates_per_cluster", 4)
+
+        clustering = MiniBatchKMeans(n_clusters=n_clusters, batch_size=block_size, n_init=3, random_state=0)
+        candidates = np.empty((0, 50, 50, 3), dtype=np.uint8), np.empty(0)
+        fitted = False
+        total = 0
+
+        block = np.empty((block_size, 50, 50, 3), dtype=np.uint8)
+        block_timestamps = np.empty(block_size)
+        count = 0
+
+        for crops, crop_timestamps in blocks:
+            for crop, timestamp in zip(crops, crop_timestamps):
+                block[count] = crop
+                block_timestamps[count] = timestamp
+                count += 1
+                if count == block_size:
+                    candidates = self._fit_block(clustering, block, block_timestamps, candidates, keep)
+                    fitted = True
+                    total += count
+                    count = 0
+
+        if not fitted:
+            # The whole video fit in one block, cluster it like the batch path does
+            print(f"Extracted {count} keyframes")
+            return self._cluster_keyframes(block[:count], block_timestamps[:count], n_clusters)
+
+        if count:
+            candidates = self._fit_block(clustering, block[:count], block_timestamps[:count], candidates, keep)
+            total += count
+        print(f"Extracted {total} keyframes, clustered online in blocks of {block_size}")
+
+        frames, timestamps = candidates
+        distances = clustering.transform(extract_features(frames, self.config))
+        labels = np.argmin(distances, axis=1)
+
+        representative_keyframes = []
+        for cluster in range(n_clusters):
+            cluster_indices = np.where(labels == cluster)[0]
+            if cluster_indices.size > 0:
+                closest_index = cluster_indices[np.argmin(distances[cluster_indices, cluster])]
+                representative_keyframes.append({"frame": frames[closest_index].copy(),
+                                                 "timestamp": float(timestamps[closest_index])})
         return representative_keyframes
+
+    def _fit_block(self, clustering, frames: np.ndarray, timestamps: np.ndarray, candidates, keep: int):
+        """Updates the clustering with one block and keeps the crops nearest to each current centre."""
+        clustering.partial_fit(extract_features(frames, self.config))
+
+        pool_frames = np.concatenate([candidates[0], frames])
+        pool_timestamps = np.concatenate([candidates[1], timestamps])
+        distances = clustering.transform(extract_features(pool_frames, self.config))
+
+        nearest = np.argsort(distances, axis=0)[:keep]
+        selected = np.unique(nearest)
+        return pool_frames[selected], pool_timestamps[selected]
+
+    def _create_clustering(self, n_clusters: int):
+        """Creates the configured clustering backend, "kmeans" or "minibatch"."""
+        backend = self.config.get("clustering", "kmeans")
+        if backend == "kmeans":
+            return KMeans(n_clusters=n_clusters, random_state=0)
+        if backend == "minibatch":
+            return MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.config.get("minibatch_size", 1024), n_init=3, random_state=0)
+        raise ValueError(f"Unknown clustering backend: {backend}")
     
     def _assign_keyframes_to_sentences(self, keyframes, document: Document):
         """Counts keyframes for each sentence based on their timestamps."""
-        sentence_keyframe_counts = [0] * len(document.sentences)
-        for kf in keyframes:
-            timestamp = kf["timestamp"]
-            for i, sentence in enumerate(document.sentences):
-                if sentence.contains(timestamp):
-                    sentence_keyframe_counts[i] += 1
-                    break
-        return sentence_keyframe_counts
+        return DocumentAnalysis.event_histogram(document, [kf["timestamp"] for kf in keyframes]).tolist()
+
+def _sample_segment(config: Dict[str, str], video_path: str, times: np.ndarray, positions: np.ndarray, block_name: str) -> int:
+    """Worker process: samples one time range with its own capture and writes crops into shared memory."""
+    extractor = KeyframeExtractor(config)
+    block = shared_memory.SharedMemory(name=block_name)
+    frames = np.ndarray((len(times), 50, 50, 3), dtype=np.uint8, buffer=block.buf)
+
+    count = 0
+    samples = extractor._frames_at(video_path, times, seek_each=config.get("sampling", "grab") == "seek")
+    for crops, _ in extractor._crop_blocks(samples, lambda n: positions[count:count + n]):
+        frames[count:count + len(crops)] = crops
+        count += len(crops)
+
+    del frames
+    block.close()
+    return count
+
+
+def _video_fingerprint(video_path: str, chunk_size: int = 1 << 20) -> str:
+    """Hashes the file size with its first and last chunk, which is enough to tell videos apart without reading them whole."""
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode("utf-8"))
+    with open(video_path, "rb") as f:
+        digest.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
@@ -0,0 +1,60 @@
+from typing import Any, Callable, Dict
+import cv2
+import numpy as np
+from sklearn.decomposition import PCA
+
+
+def raw_features(frames: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
+    """Flattens each 50x50x3 crop into one 7500-dimensional pixel vector."""
+    return frames.reshape(len(frames), -1)
+
+
+def hsv_histogram_features(frames: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
+    """Computes a normalized joint HSV colour histogram per crop."""
+    h_bins, s_bins, v_bins = config.get("hsv_bins", (8, 4, 4))
+    n, height, width, _ = frames.shape
+
+    # Stack the crops vertically so one cvtColor call converts the whole block
+    hsv = cv2.cvtColor(np.ascontiguousarray(frames).reshape(n * height, width, 3), cv2.COLOR_BGR2HSV).reshape(n, -1, 3).astype(np.int64)
+    bins = (hsv[..., 0] * h_bins // 180) * s_bins * v_bins + (hsv[..., 1] * s_bins // 256) * v_bins + hsv[..., 2] * v_bins // 256
+
+    n_bins = h_bins * s_bins * v_bins
+    offsets = (np.arange(n) * n_bins)[:, None]
+    histograms = np.bincount((bins + offsets).ravel(), minlength=n * n_bins).reshape(n, n_bins)
+
+    return (histograms / (height * width)).astype(np.float32)
+
+
+def grayscale_features(frames: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
+    """Converts each crop to grayscale and block-averages it down to gray_size x gray_size."""
+    size = config.get("gray_size", 10)
+    n, height, width, _ = frames.shape
+    assert height % size == 0 and width % size == 0, f"gray_size must divide the {height}x{width} crop"
+
+    gray = cv2.cvtColor(np.ascontiguousarray(frames).reshape(n * height, width, 3), cv2.COLOR_BGR2GRAY).reshape(n, height, width)
+    blocks = gray.reshape(n, size, height // size, size, width // size).astype(np.float32)
+
+    return blocks.mean(axis=(2, 4)).reshape(n, -1)
+
+
+def pca_features(frames: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
+    """Projects the raw pixels onto their first principal components."""
+    pixels = raw_features(frames, config).astype(np.float32)
+    n_components = min(config.get("pca_components", 32), len(pixels), pixels.shape[1])
+    return PCA(n_components=n_components, random_state=0).fit_transform(pixels).astype(np.float32)
+
+
+FEATURE_EXTRACTORS: Dict[str, Callable[[np.ndarray, Dict[str, Any]], np.ndarray]] = {
+    "raw": raw_features,
+    "hsv_histogram": hsv_histogram_features,
+    "grayscale": grayscale_features,
+    "pca": pca_features,
+}
+
+
+def extract_features(frames: np.ndarray, config: Dict[str, Any]) -> np.ndarray:
+    """Computes one feature vector per (N, 50, 50, 3) crop with the configured extractor."""
+    name = config.get("features", "raw")
+    if name not in FEATURE_EXTRACTORS:
+        raise ValueError(f"Unknown keyframe feature extractor: {name}")
+    return FEATURE_EXTRACTORS[name](frames, config)
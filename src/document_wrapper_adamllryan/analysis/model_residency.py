@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+import gc
+import os
+import threading
+import time
+import torch
+
+
+def current_memory_mb() -> float:
+    """Resident set size of this process plus the CUDA memory allocated by torch, in MB."""
+
+    rss = 0.0
+    try:
+        with open("/proc/self/statm", "r") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        pass  # No procfs, only CUDA memory is counted
+    if torch.cuda.is_available():
+        rss += torch.cuda.memory_allocated() / 2 ** 20
+    return rss
+
+
+class ModelResidency:
+    """
+    Keeps loaded models across batches while their combined footprint fits memory_budget_mb,
+    evicting the least recently used ones when a new model needs room.
+
+    A model's footprint is the memory growth measured around its loader. Models in use are
+    never evicted, and a model larger than the budget is still loaded, alone.
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.budget = self.config.get("memory_budget_mb", 0)
+
+        # Name -> model, ordered from least to most recently used
+        self.models: "OrderedDict[str, Any]" = OrderedDict()
+        # Footprints are remembered after eviction, so room can be made before a reload
+        self.footprints: Dict[str, float] = {}
+        self.in_use: Dict[str, int] = {}
+        self.loading = set()
+
+        # Guards the fields above, and is never held while a loader runs
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Loads run one at a time so concurrent loads do not skew each other's measurements
+        self._load_lock = threading.Lock()
+
+    @contextmanager
+    def use(self, name: str, loader: Callable[[], Any]) -> Iterator[Any]:
+        """
+        Yields the named model, calling loader to load it if it is not resident.
+
+        The model cannot be evicted until the block exits. Borrowing a resident model never waits
+        for another model's load.
+        """
+
+        model = self._acquire(name, loader)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self.in_use[name] -= 1
+
+    def _acquire(self, name: str, loader: Callable[[], Any]) -> Any:
+        """Pins the named model, loading it outside the lock if needed."""
+
+        with self._changed:
+            # Another thread is loading this model, wait for it instead of loading it twice
+            while name in self.loading:
+                self._changed.wait()
+            self.in_use[name] = self.in_use.get(name, 0) + 1
+            if name in self.models:
+                self.models.move_to_end(name)
+                return self.models[name]
+            self.loading.add(name)
+
+        try:
+            with self._load_lock:
+                with self._lock:
+                    self._make_room(self.footprints.get(name, 0.0), keep=name)
+                model = self._load(name, loader)
+        except BaseException:
+            with self._changed:
+                self.in_use[name] -= 1
+                self.loading.discard(name)
+                self._changed.notify_all()
+            raise
+
+        with self._changed:
+            self.models[name] = model
+            self.loading.discard(name)
+            self._make_room(0.0, keep=name)
+            self._changed.notify_all()
+        return model
+
+    def _load(self, name: str, loader: Callable[[], Any]) -> Any:
+        before = current_memory_mb()
+        start = time.time()
+        model = loader()
+        elapsed = time.time() - start
+        self.footprints[name] = max(current_memory_mb() - before, 0.0)
+        print(f"Loaded model {name} in {elapsed:.2f} seconds, {self.footprints[name]:.0f} MB")
+        return model
+
+    def _make_room(self, needed: float, keep: str):
+        """Evicts least recently used idle models until needed more MB fit in the budget."""
+
+        for name in list(self.models):
+            if self.resident_mb() + needed <= self.budget:
+                return
+            if name != keep and not self.in_use.get(name):
+                self._evict(name)
+
+    def _evict(self, name: str):
+        start = time.time()
+        del self.models[name]
+        gc.collect()
+        torch.cuda.empty_cache()
+        print(f"Evicted model {name} in {time.time() - start:.2f} seconds, freeing {self.footprints[name]:.0f} MB")
+
+    def resident_mb(self) -> float:
+        """Combined footprint of the resident models."""
+        return sum(self.footprints[name] for name in self.models)
+
+    def clear(self):
+        """Evicts every model that is not in use."""
+        with self._lock:
+            for name in list(self.models):
+                if not self.in_use.get(name):
+                    self._evict(name)
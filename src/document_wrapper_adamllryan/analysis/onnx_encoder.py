@@ -0,0 +1,161 @@
+from typing import Any, Dict, List, Union
+import inspect
+import json
+import os
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+
+class OnnxSentenceEncoder:
+    """
+    Runs a sentence-transformers model through ONNX Runtime. The model is exported once and the graph is cached on disk.
+    """
+    def __init__(self, model_name: str, config: Dict[str, Any]):
+        self.model_name = model_name
+        self.config = config
+
+        self.path = os.path.join(self.config.get("cache_dir", "onnx_models"), model_name.replace("/", "__"))
+        self.graph_path = os.path.join(self.path, "model.onnx")
+        self.settings_path = os.path.join(self.path, "settings.json")
+
+        if not (os.path.exists(self.graph_path) and os.path.exists(self.settings_path)):
+            self._export()
+
+        with open(self.settings_path, "r", encoding="utf-8") as f:
+            self.settings = json.load(f)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.config.get("intra_op_threads", 0)
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(self.graph_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(self.path)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.settings["dim"]
+
+    def encode(self, texts: Union[List[str], str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Encodes texts into sentence embeddings, mirroring SentenceTransformer.encode."""
+
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        embeddings = np.zeros((len(texts), self.settings["dim"]), dtype=np.float32)
+
+        # Sort by length so each batch pads as little as possible
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            features = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.settings["max_seq_length"],
+                return_tensors="np"
+            )
+            token_embeddings = self.session.run(None, {name: features[name].astype(np.int64) for name in self.input_names})[0]
+            embeddings[indices] = self._pool(token_embeddings, features["attention_mask"])
+
+        return embeddings[0] if single else embeddings
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Pools token embeddings the same way the exported model's pooling layer does."""
+
+        mask = attention_mask[..., None].astype(np.float32)
+        pooling = self.settings["pooling"]
+
+        if pooling == "cls":
+            pooled = token_embeddings[:, 0]
+        elif pooling == "max":
+            pooled = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        elif pooling == "mean":
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        else:
+            raise ValueError(f"Unsupported pooling mode for ONNX backend: {pooling}")
+
+        if self.settings["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+        return pooled
+
+    def _export(self) -> None:
+        """Exports the transformer to ONNX and checks the embeddings match the PyTorch model."""
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        print(f"Exporting {self.model_name} to ONNX at {self.path}")
+        os.makedirs(self.path, exist_ok=True)
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        model.eval()
+        transformer, pooling = model[0], model[1]
+        tokenizer = transformer.tokenizer
+
+        sample = tokenizer(["Exporting the sentence embedding model."], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _TokenEmbeddings(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]}
+
+        # Newer torch versions default to the dynamo exporter, which does not take dynamic_axes
+        export_options = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_options["dynamo"] = False
+
+        with torch.no_grad():
+            torch.onnx.export(
+                _TokenEmbeddings(transformer.auto_model),
+                tuple(sample[name] for name in input_names),
+                self.graph_path,
+                input_names=input_names,
+                output_names=["token_embeddings"],
+                dynamic_axes=dynamic_axes,
+                opset_version=self.config.get("opset", 14),
+                **export_options
+            )
+
+        # Older sentence-transformers releases only expose the pooling mode through a getter
+        pooling_mode = pooling.get_pooling_mode_str() if hasattr(pooling, "get_pooling_mode_str") else pooling.pooling_mode
+
+        tokenizer.save_pretrained(self.path)
+        with open(self.settings_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "pooling": pooling_mode,
+                "normalize": any(type(module).__name__ == "Normalize" for module in model),
+                "max_seq_length": transformer.max_seq_length,
+                "dim": model.get_sentence_embedding_dimension(),
+            }, f, indent=4)
+
+        self._verify(model)
+
+    def _verify(self, reference: Any) -> None:
+        """Compares ONNX embeddings with the reference model, removing the export if they drift."""
+
+        texts = [
+            "SPEAKER_00: But I'm not going to talk specifically about the attack on SHA today",
+            "UNKNOWN: Short one.",
+            "SPEAKER_01: " + " ".join(["A much longer sentence that needs more padding"] * 8),
+        ]
+        tolerance = self.config.get("verify_tolerance", 1e-4)
+
+        verifier = OnnxSentenceEncoder(self.model_name, {**self.config, "intra_op_threads": 1})
+        difference = float(np.abs(verifier.encode(texts) - reference.encode(texts)).max())
+        print(f"ONNX export max embedding difference: {difference:.2e}")
+
+        if difference > tolerance:
+            os.remove(self.graph_path)
+            os.remove(self.settings_path)
+            raise AssertionError(f"ONNX embeddings differ from {self.model_name} by {difference}, tolerance is {tolerance}")
@@ -0,0 +1,139 @@
+from typing import Callable, Dict, List, Optional, Sequence
+import queue
+import threading
+import time
+
+
+class PipelineStage:
+    """
+    One step of a Pipeline: workers threads call fn on up to batch items at a time.
+
+    Stages that share a lock never run at the same time, which keeps a model to one caller.
+    """
+    def __init__(self, name: str, fn: Callable[[List[str]], None], workers: int = 1, batch: int = 1, locks: Sequence[threading.Lock] = ()):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch = batch
+        self.locks = list(locks)
+
+        self.busy = 0.0
+        self.processed = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues, so each item moves on as soon
+    as its stage is done instead of waiting for the whole batch.
+
+    An item whose stage raises is reported and skips the remaining stages.
+    """
+    _DONE = object()
+
+    def __init__(self, stages: List[PipelineStage], queue_size: int = 2):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.failed: Dict[str, str] = {}
+        self._finished = [0] * len(stages)
+        self._lock = threading.Lock()
+
+    def run(self, items: List[str]) -> Dict[str, str]:
+        """
+        Pushes every item through every stage and waits for them to finish.
+
+        Returns:
+            The error message of each item that failed, by item.
+        """
+
+        start = time.time()
+        threads = [
+            threading.Thread(target=self._work, args=(s,), name=f"{stage.name}-{w}", daemon=True)
+            for s, stage in enumerate(self.stages) for w in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        for item in items:
+            self.queues[0].put(item)
+        self.queues[0].put(self._DONE)
+
+        for thread in threads:
+            thread.join()
+
+        self.report(time.time() - start)
+        return self.failed
+
+    def _work(self, s: int):
+        """Worker loop of stage s, forwards items to the next stage's queue."""
+
+        stage, inbox = self.stages[s], self.queues[s]
+        outbox = self.queues[s + 1] if s + 1 < len(self.stages) else None
+
+        while True:
+            items = [inbox.get()]
+            # Take whatever else is already waiting, up to the stage's batch size
+            while len(items) < stage.batch and items[-1] is not self._DONE:
+                try:
+                    items.append(inbox.get_nowait())
+                except queue.Empty:
+                    break
+
+            done = items[-1] is self._DONE
+            if done:
+                items.pop()
+                # Let sibling workers of this stage see the end too
+                inbox.put(self._DONE)
+
+            with self._lock:
+                stage.depth_samples += 1
+                stage.depth_total += inbox.qsize()
+                stage.max_depth = max(stage.max_depth, inbox.qsize() + len(items))
+
+            pending = [item for item in items if item not in self.failed]
+            if pending:
+                self._call(stage, pending)
+            if outbox is not None:
+                for item in items:
+                    outbox.put(item)
+
+            if done:
+                with self._lock:
+                    self._finished[s] += 1
+                    last = self._finished[s] == stage.workers
+                if last and outbox is not None:
+                    outbox.put(self._DONE)
+                return
+
+    def _call(self, stage: PipelineStage, items: List[str]):
+        for lock in stage.locks:
+            lock.acquire()
+        # Time spent waiting for a shared model is not counted as busy
+        start = time.time()
+        try:
+            stage.fn(items)
+        except Exception as e:
+            print(f"Stage {stage.name} failed for {', '.join(items)}: {e!r}")
+            with self._lock:
+                for item in items:
+                    self.failed[item] = f"{stage.name}: {e!r}"
+        finally:
+            for lock in reversed(stage.locks):
+                lock.release()
+            with self._lock:
+                stage.busy += time.time() - start
+                stage.processed += len(items)
+
+    def report(self, elapsed: Optional[float] = None):
+        """Prints the items processed, mean and max input queue depth and utilisation of every stage."""
+
+        print(f"Pipeline finished in {elapsed:.2f} seconds" if elapsed else "Pipeline stages")
+        for stage in self.stages:
+            mean_depth = stage.depth_total / stage.depth_samples if stage.depth_samples else 0.0
+            utilisation = stage.busy / (stage.workers * elapsed) if elapsed else 0.0
+            print(
+                f"  {stage.name:<12} {stage.processed:>4} items  queue mean {mean_depth:.1f} max {stage.max_depth}"
+                f"  busy {stage.busy:.2f}s  utilisation {utilisation:.0%} over {stage.workers} workers"
+            )
@@ -0,0 +1,73 @@
+from typing import Any, Dict, Iterable, Tuple
+import cv2
+import numpy as np
+
+
+class SceneChangeDetector:
+    """
+    Measures visual change between consecutive sampled frames.
+
+    Frames are shrunk to small grayscale images as they arrive and compared a block at a time,
+    so only one block of thumbnails is ever held in memory.
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.metric = self.config.get("scene_metric", "histogram")
+        self.width, self.height = self.config.get("scene_size", (64, 36))
+        self.bins = self.config.get("scene_bins", 32)
+        self.block_size = self.config.get("scene_block", 256)
+        assert self.metric in ("histogram", "pixel"), f"Unknown scene change metric: {self.metric}"
+        assert 256 % self.bins == 0, "scene_bins must divide 256"
+
+    def detect(self, samples: Iterable[Tuple[np.ndarray, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the change between each sampled frame and the one before it.
+
+        Args:
+            samples: (frame, timestamp) pairs in time order, BGR or already scaled grayscale frames.
+
+        Returns:
+            The timestamp of every frame after the first, and the change leading into it in [0, 1].
+        """
+
+        block = np.empty((self.block_size + 1, self.height, self.width), dtype=np.uint8)
+        block_timestamps = np.empty(self.block_size + 1)
+        timestamps, changes = [], []
+        count = 0
+
+        for frame, timestamp in samples:
+            if frame.shape != (self.height, self.width):
+                frame = cv2.cvtColor(cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            block[count] = frame
+            block_timestamps[count] = timestamp
+            count += 1
+            if count == len(block):
+                changes.append(self._differences(block))
+                timestamps.append(block_timestamps[1:].copy())
+                # The last frame of this block is the reference for the next one
+                block[0], block_timestamps[0] = block[-1], block_timestamps[-1]
+                count = 1
+
+        if count > 1:
+            changes.append(self._differences(block[:count]))
+            timestamps.append(block_timestamps[1:count].copy())
+
+        if not changes:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(timestamps), np.concatenate(changes)
+
+    def _differences(self, frames: np.ndarray) -> np.ndarray:
+        """Change between each pair of consecutive frames in a (N, H, W) block, N - 1 values."""
+
+        if self.metric == "pixel":
+            # Mean absolute pixel difference, a motion energy measure
+            diff = np.abs(frames[1:].astype(np.int16) - frames[:-1].astype(np.int16))
+            return diff.reshape(len(diff), -1).mean(axis=1) / 255.0
+
+        # Half the L1 distance between normalized intensity histograms, robust to small motion
+        n = len(frames)
+        binned = (frames.reshape(n, -1) // (256 // self.bins)).astype(np.int64)
+        offsets = (np.arange(n) * self.bins)[:, None]
+        histograms = np.bincount((binned + offsets).ravel(), minlength=n * self.bins).reshape(n, self.bins)
+        histograms = histograms / binned.shape[1]
+        return 0.5 * np.abs(histograms[1:] - histograms[:-1]).sum(axis=1)
@@ -0,0 +1,281 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import numpy as np
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
+from document_wrapper_adamllryan.doc.document import Document
+
+
+class SentenceIndex:
+    """
+    Corpus-level vector index over the sentence embeddings of processed videos.
+
+    Every video is stored as its own shard, together with its IVF list assignments, so adding a video
+    never rewrites the rest of the index. In memory, rows live in buffers that grow by doubling.
+    Small corpora are searched exhaustively, larger ones through an inverted file (IVF) of k-means lists.
+    """
+    def __init__(self, path: str, config: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.config = config if config else {}
+        self.shard_dir = os.path.join(self.path, "videos")
+        self.manifest_path = os.path.join(self.path, "index.json")
+        self.ivf_path = os.path.join(self.path, "ivf.npz")
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        self.ivf_min_size = self.config.get("ivf_min_size", 20000)
+        self.n_probe = self.config.get("n_probe", 8)
+
+        self.video_ids: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        # Bumped on every rebuild_ivf, shards assigned to older centroids are stale
+        self.ivf_version = 0
+
+        # Row buffers, only the first _size rows are in use
+        self._size = 0
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int64)  # Row -> position in video_ids
+        self._starts = np.zeros(0)
+        self._ends = np.zeros(0)
+        self._assignments = np.zeros(0, dtype=np.int64)
+
+        self._load()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    @property
+    def owners(self) -> np.ndarray:
+        return self._owners[:self._size]
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self._starts[:self._size]
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self._ends[:self._size]
+
+    @property
+    def assignments(self) -> Optional[np.ndarray]:
+        return None if self.centroids is None else self._assignments[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.video_ids
+
+    def _load(self) -> None:
+        """Loads every shard listed in the manifest, plus the IVF lists if they are still valid."""
+
+        if not os.path.exists(self.manifest_path):
+            return
+
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            video_ids = json.load(f)["videos"]
+
+        if not video_ids:
+            return
+
+        # Each shard is read into plain arrays and closed, so open files never grow with the corpus
+        shards = [self._read_shard(video_id) for video_id in video_ids]
+
+        # Concatenate once, appending shard by shard would copy the corpus for every video
+        self.video_ids = list(video_ids)
+        self._vectors = np.concatenate([shard["vectors"] for shard in shards]).astype(np.float32)
+        self._owners = np.repeat(np.arange(len(shards)), [len(shard["starts"]) for shard in shards])
+        self._starts = np.concatenate([shard["starts"] for shard in shards])
+        self._ends = np.concatenate([shard["ends"] for shard in shards])
+        self._assignments = np.zeros(len(self._owners), dtype=np.int64)
+        self._size = len(self._owners)
+
+        # The lists are only usable if every shard was assigned to the current centroids
+        if os.path.exists(self.ivf_path):
+            with np.load(self.ivf_path) as ivf:
+                version = int(ivf["version"]) if "version" in ivf else -1
+                centroids = ivf["centroids"]
+            if all("assignments" in shard and int(shard["ivf_version"]) == version for shard in shards):
+                self.centroids = centroids
+                self.ivf_version = version
+                self._assignments = np.concatenate([shard["assignments"] for shard in shards]).astype(np.int64)
+
+        print(f"Loaded sentence index with {len(self)} sentences from {len(self.video_ids)} videos")
+
+    def _read_shard(self, video_id: str) -> Dict[str, np.ndarray]:
+        """Reads every array of a video's shard into memory."""
+        with np.load(self._shard_path(video_id)) as shard:
+            return {name: shard[name] for name in shard.files}
+
+    def _shard_path(self, video_id: str) -> str:
+        return os.path.join(self.shard_dir, f"{video_id}.npz")
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Grows the row buffers by doubling until rows more fit, so appends copy O(1) rows on average."""
+
+        needed = self._size + rows
+        if needed <= len(self._owners) and self._vectors.shape[1] == dim:
+            return
+
+        capacity = max(needed, 2 * len(self._owners), 256)
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        if self._size:
+            vectors[:self._size] = self.vectors
+        self._vectors = vectors
+        for name in ("_owners", "_starts", "_ends", "_assignments"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:self._size] = old[:self._size]
+            setattr(self, name, grown)
+
+    def _append(self, video_id: str, vectors: np.ndarray, starts: np.ndarray, ends: np.ndarray, assignments: Optional[np.ndarray] = None) -> None:
+        """Appends rows for a video to the in-memory buffers."""
+
+        self._reserve(len(vectors), vectors.shape[1])
+        rows = slice(self._size, self._size + len(vectors))
+        self.video_ids.append(video_id)
+        self._vectors[rows] = vectors
+        self._owners[rows] = len(self.video_ids) - 1
+        self._starts[rows] = starts
+        self._ends[rows] = ends
+        if assignments is not None:
+            self._assignments[rows] = assignments
+        self._size += len(vectors)
+
+    def _remove(self, video_id: str) -> None:
+        """Drops all rows of a video from the in-memory buffers, compacting the rows after it."""
+
+        position = self.video_ids.index(video_id)
+        keep = np.flatnonzero(self.owners != position)
+
+        for name in ("_vectors", "_owners", "_starts", "_ends", "_assignments"):
+            buffer = getattr(self, name)
+            buffer[:len(keep)] = buffer[keep]
+        self._size = len(keep)
+        self.owners[self.owners > position] -= 1
+        del self.video_ids[position]
+
+    def add_document(self, video_id: str, document: Document) -> int:
+        """
+        Adds, or replaces, the sentences of a processed video.
+
+        Returns:
+            The number of sentences added, sentences without embeddings are skipped.
+        """
+
+        embeddings = [e["text"] for e in document.call_track_method("get_embeddings", "text")]
+        rows = [i for i, embedding in enumerate(embeddings) if len(embedding) > 0]
+
+        if video_id in self:
+            self._remove(video_id)
+        if not rows:
+            self.save()
+            return 0
+
+        vectors = np.asarray([embeddings[i] for i in rows], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        starts = np.array([document.sentences[i].start for i in rows], dtype=np.float64)
+        ends = np.array([document.sentences[i].end for i in rows], dtype=np.float64)
+
+        # New rows join the nearest existing list, rebuild_ivf re-trains from scratch
+        assignments = self._nearest_centroids(vectors) if self.centroids is not None else None
+        self._save_shard(video_id, vectors, starts, ends, assignments)
+        self._append(video_id, vectors, starts, ends, assignments)
+
+        self.save()
+        # Lists are trained once the corpus is big enough, call rebuild_ivf to re-train them later
+        if self.centroids is None and len(self) >= self.ivf_min_size:
+            self.rebuild_ivf()
+        return len(rows)
+
+    def add_output(self, video_id: str, output_path: str) -> int:
+        """Adds a video straight from its exported output.json."""
+
+        with open(output_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return self.add_document(video_id, DocumentAnalysis.list_to_document_from_processed(data["sentences"], data["metadata"]))
+
+    def _save_shard(self, video_id: str, vectors: np.ndarray, starts: np.ndarray, ends: np.ndarray, assignments: Optional[np.ndarray]) -> None:
+        if assignments is None:
+            np.savez(self._shard_path(video_id), vectors=vectors, starts=starts, ends=ends)
+        else:
+            np.savez(self._shard_path(video_id), vectors=vectors, starts=starts, ends=ends, assignments=assignments, ivf_version=self.ivf_version)
+
+    def save(self) -> None:
+        """Writes the manifest, shards are written as they are added and the centroids when they are built."""
+
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"videos": self.video_ids}, f)
+
+        if self.centroids is None and os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+
+    def rebuild_ivf(self, n_lists: Optional[int] = None) -> None:
+        """Trains k-means lists over the current vectors and assigns every row to one of them."""
+
+        n_lists = n_lists or self.config.get("n_lists") or max(1, int(np.sqrt(len(self))))
+        n_lists = min(n_lists, len(self))
+        rng = np.random.default_rng(self.config.get("seed", 0))
+
+        # Train on a sample, which is plenty for coarse lists
+        sample_size = min(len(self), self.config.get("train_size", 64 * n_lists))
+        sample = self.vectors[rng.choice(len(self), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.config.get("train_iterations", 10)):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids
+        self.ivf_version += 1
+        self._assignments[:self._size] = self._nearest_centroids(self.vectors)
+
+        # Every shard gets the new assignments, then the centroids make them current
+        for position, video_id in enumerate(self.video_ids):
+            rows = self.owners == position
+            self._save_shard(video_id, self.vectors[rows], self.starts[rows], self.ends[rows], self.assignments[rows])
+        np.savez(self.ivf_path, centroids=self.centroids, version=self.ivf_version)
+        self.save()
+        print(f"Built IVF index with {n_lists} lists over {len(self)} sentences")
+
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def search(self, query: np.ndarray, k: int = 10) -> List[Tuple[str, float, float, float]]:
+        """
+        Finds the sentences most similar to a query embedding.
+
+        Returns:
+            Up to k (video_id, start, end, score) tuples, best first.
+        """
+
+        if len(self) == 0:
+            return []
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        # Searching never trains or writes anything, an index without lists is searched exhaustively
+        if self.centroids is None:
+            candidates = np.arange(len(self))
+        else:
+            probe = np.argsort(-(self.centroids @ query))[:self.n_probe]
+            candidates = np.flatnonzero(np.isin(self.assignments, probe))
+
+        # Every probed list can be empty, e.g. after videos were replaced
+        if len(candidates) == 0:
+            return []
+
+        scores = self.vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            (self.video_ids[self.owners[row]], float(self.starts[row]), float(self.ends[row]), float(score))
+            for row, score in zip(candidates[top], scores[top])
+        ]
@@ -1,6 +1,7 @@
 from typing import Dict, List, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+from document_wrapper_adamllryan.analysis.embedding_cache import EmbeddingCache
 from document_wrapper_adamllryan.doc.document import Document
 from document_wrapper_adamllryan.doc.sentence import Sentence 
 
@@ -11,31 +12,172 @@ class SentenceScorer:
     """
     def __init__(self, config: Dict[str, str]):
         self.config = config
-        self.model = SentenceTransformer(self.config["embedding_model"])
+        self.model = self.load_model(self.config)
+        self.batch_size = self.config.get("batch_size", 32)
+
+        self.cache = None
+        if self.config.get("embedding_cache"):
+            cache_config = self.config["embedding_cache"]
+            self.cache = EmbeddingCache(
+                cache_config["path"],
+                self.config["embedding_model"],
+                self.model.get_sentence_embedding_dimension(),
+                cache_config.get("max_entries", 100000)
+            )
     
+    @staticmethod
+    def load_model(config: Dict[str, str]):
+        """Loads the embedding model with the configured backend, either "torch" or "onnx"."""
+
+        backend = config.get("backend", "torch")
+        if backend == "onnx":
+            # onnxruntime is only needed when this backend is selected
+            from document_wrapper_adamllryan.analysis.onnx_encoder import OnnxSentenceEncoder
+            return OnnxSentenceEncoder(config["embedding_model"], config.get("onnx", {}))
+
+        assert backend == "torch", f"Unknown embedding backend: {backend}"
+        return SentenceTransformer(config["embedding_model"])
+
     def score(self, document: Document):
         """Computes similarity scores and assigns embeddings for each sentence in the document."""
-        print("Computing sentence scores")
-        
-        summary = document.metadata.get("summary", "")
-        summary_embedding = self.model.encode([summary])  # Encode summary once
-        
-        scores = []
-        embeddings = []
-
-        plaintext_sentences = [
-            sentence.call_track_method("get_formatted_text", "text")
-            for sentence in document.sentences
-        ]
-
-        # print("Sentences", plaintext_sentences)
-
-        embeddings = self.model.encode(plaintext_sentences).tolist()
-        scores = util.cos_sim(summary_embedding, embeddings).tolist()[0]
-        # print(f"Scores: {scores}")
-        # print(f"Embeddings: {embeddings}")
-        
-        
-        
-        document.call_track_method("set_score", "text", scores)
-        document.call_track_method("set_embeddings", "text", embeddings)
+        self.score_many([document])
+
+    def score_many(self, documents: List[Document]):
+        """
+        Computes similarity scores and assigns embeddings for several documents in one encoding pass.
+
+        Blank sentences are skipped and identical sentences are encoded once. Everything left goes to
+        the model in one encode call, whose length sorting then batches sentences of similar length
+        across all documents, so padding stays small. Every query from build_queries is scored too.
+        """
+        print(f"Computing sentence scores for {len(documents)} documents")
+
+        embeddings = self._embed_many(documents)
+        queries = [self.build_queries(document) for document in documents]
+
+        # Encode the queries of every document in a single batch
+        query_embeddings = self.model.encode([text for q in queries for text in q.values()], batch_size=self.batch_size)
+
+        offset = 0
+        for document, document_embeddings, document_queries in zip(documents, embeddings, queries):
+            matrix = self._cosine_matrix(query_embeddings[offset:offset + len(document_queries)], document_embeddings)
+            offset += len(document_queries)
+            self._store_query_scores(document, list(document_queries), matrix)
+
+    def score_queries(self, document: Document, queries: Dict[str, str]) -> np.ndarray:
+        """
+        Scores every sentence against several named queries at once.
+
+        Args:
+            document: The document to score.
+            queries: Query text keyed by the name of its score column.
+
+        Returns:
+            A (queries x sentences) cosine similarity matrix, in the order of the queries.
+        """
+
+        embeddings = self.embed(document)
+        matrix = self._cosine_matrix(self.model.encode(list(queries.values()), batch_size=self.batch_size), embeddings)
+        self._store_query_scores(document, list(queries), matrix)
+
+        return matrix
+
+    @staticmethod
+    def build_queries(document: Document) -> Dict[str, str]:
+        """Collects the summary, user topics and chapter titles from the document metadata."""
+
+        queries = {"summary": document.metadata.get("summary", "")}
+        for topic in document.metadata.get("topics", []):
+            queries[f"topic:{topic}"] = topic
+        for chapter in document.metadata.get("chapters", []):
+            title = chapter.get("title", "") if isinstance(chapter, dict) else str(chapter)
+            queries[f"chapter:{title}"] = title
+
+        return queries
+
+    @staticmethod
+    def _store_query_scores(document: Document, names: List[str], matrix: np.ndarray) -> None:
+        """Stores one named score column per query, the summary column is also the text score."""
+
+        columns = matrix.T.tolist()
+        document.call_track_method("add_query_scores", "text", [dict(zip(names, row)) for row in columns])
+
+        if "summary" in names:
+            document.call_track_method("set_score", "text", matrix[names.index("summary")].tolist())
+
+    def embed(self, document: Document) -> np.ndarray:
+        """Computes embeddings for each sentence in the document, reusing any that are already stored."""
+        return self._embed_many([document])[0]
+
+    def _embed_many(self, documents: List[Document]) -> List[np.ndarray]:
+        """Computes one embedding matrix per document, blank sentences are left as zero rows."""
+
+        dim = self.model.get_sentence_embedding_dimension()
+        results: List[Optional[np.ndarray]] = [None] * len(documents)
+        pending = []
+
+        for d, document in enumerate(documents):
+            keep = self._content_indices(document)
+            stored = [e["text"] for e in document.call_track_method("get_embeddings", "text")]
+            if all(len(stored[i]) > 0 for i in keep):
+                results[d] = np.zeros((len(document.sentences), dim), dtype=np.float32)
+                if keep:
+                    results[d][keep] = np.asarray([stored[i] for i in keep], dtype=np.float32)
+                continue
+
+            texts = [document.sentences[i].call_track_method("get_formatted_text", "text")["text"] for i in keep]
+            pending.append((d, keep, texts))
+
+        # Deduplicate across documents, the encoder sorts the rest by length into batches itself
+        unique = list(dict.fromkeys(text for _, _, texts in pending for text in texts))
+        rows = {}
+        if unique:
+            print(f"Encoding {len(unique)} unique sentences from {len(pending)} documents")
+            rows = dict(zip(unique, self._encode(unique)))
+
+        for d, keep, texts in pending:
+            embeddings = np.zeros((len(documents[d].sentences), dim), dtype=np.float32)
+            stored = [[] for _ in documents[d].sentences]
+            for i, text in zip(keep, texts):
+                embeddings[i] = rows[text]
+                stored[i] = embeddings[i].tolist()
+            documents[d].call_track_method("set_embeddings", "text", stored)
+            results[d] = embeddings
+
+        return results
+
+    @staticmethod
+    def _content_indices(document: Document) -> List[int]:
+        """Retrieves the indices of sentences that contain text."""
+        return [i for i, s in enumerate(document.sentences) if str(s).strip()]
+
+    @staticmethod
+    def _cosine_matrix(queries: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+        """Computes cosine similarity of each query against each row, zero rows score 0."""
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, embeddings.shape[1])
+        norms = np.outer(np.linalg.norm(queries, axis=1), np.linalg.norm(embeddings, axis=1))
+        return np.divide(queries @ embeddings.T, norms, out=np.zeros(norms.shape), where=norms > 0)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes sentences, only running the model for those missing from the embedding cache."""
+
+        if self.cache is None:
+            return self.model.encode(texts, batch_size=self.batch_size)
+
+        embeddings, missing = self.cache.lookup(texts)
+        if missing:
+            # Identical sentences only need to be encoded once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = self.model.encode(unique, batch_size=self.batch_size)
+            rows = {text: row for text, row in zip(unique, encoded)}
+            for i in missing:
+                embeddings[i] = rows[texts[i]]
+            self.cache.store(unique, encoded)
+
+        # Hits reorder the LRU too, so an all-hit run still saves the new recency
+        if self.cache.dirty:
+            self.cache.flush()
+
+        print(f"Embedding cache: {self.cache.stats()}")
+        return embeddings
@@ -1,7 +1,120 @@
 
+from concurrent.futures import ThreadPoolExecutor
 import os
 import subprocess
-from typing import List, Tuple
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import numpy as np
+
+# Encoders for each source codec, so smart cut boundaries are re-encoded in the codec of the copied pieces
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265", "vp9": "libvpx-vp9", "av1": "libaom-av1", "mpeg4": "mpeg4"}
+AUDIO_ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus", "vorbis": "libvorbis", "ac3": "ac3"}
+
+# ffprobe profile names as each encoder spells them, other profiles cannot be matched
+ENCODER_PROFILES = {
+    "libx264": {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+                "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444"},
+    "libx265": {"Main": "main", "Main 10": "main10", "Main Still Picture": "mainstillpicture"},
+    "aac": {"LC": "aac_low"},
+}
+
+
+def coalesce_ranges(ranges: Sequence[Sequence[float]], gap_tolerance: float = 0.0, min_duration: float = 0.0) -> List[Tuple[float, float]]:
+    """
+    Sorts (start, end) ranges and merges those that overlap or are separated by at most gap_tolerance
+    seconds, then drops merged ranges shorter than min_duration.
+    """
+
+    if len(ranges) == 0:
+        return []
+
+    ranges = np.asarray(ranges, dtype=np.float64).reshape(-1, 2)
+    ranges = ranges[np.argsort(ranges[:, 0], kind="stable")]
+    starts, ends = ranges[:, 0], ranges[:, 1]
+
+    # A new group starts wherever the gap to the furthest end reached so far exceeds the tolerance
+    reach = np.maximum.accumulate(ends)
+    breaks = np.flatnonzero(starts[1:] > reach[:-1] + gap_tolerance) + 1
+    first = np.concatenate([[0], breaks])
+    last = np.concatenate([breaks, [len(ranges)]]) - 1
+
+    merged_starts, merged_ends = starts[first], reach[last]
+    keep = merged_ends - merged_starts >= min_duration
+    return list(zip(merged_starts[keep].tolist(), merged_ends[keep].tolist()))
+
+
+def multi_splice_graph(outputs: Sequence[Sequence[Sequence[float]]], audio: bool) -> Tuple[str, List[Tuple[float, float]]]:
+    """
+    Builds the filter_complex of Splicer.splice_multi. Every distinct range is trimmed once and split
+    between the outputs that use it, then output k concatenates its ranges into [vout{k}] and, with
+    audio, [aout{k}].
+
+    Each output's ranges are coalesced first, so a range listed twice is only used once. The union of
+    all ranges gives the input windows: input w is the source seeked to windows[w], and ranges are
+    trimmed relative to the window holding them, so gaps between windows are never decoded.
+
+    Returns:
+        The graph and the (start, end) window of each input.
+    """
+
+    per_output = [coalesce_ranges(timestamps) for timestamps in outputs]
+    assert all(per_output), "Every output needs at least one range"
+
+    ranges = sorted({r for output_ranges in per_output for r in output_ranges})
+    index = {r: i for i, r in enumerate(ranges)}
+    used = [set(output_ranges) for output_ranges in per_output]
+    users = [[k for k in range(len(per_output)) if r in used[k]] for r in ranges]
+    streams = ["v", "a"] if audio else ["v"]
+
+    windows = coalesce_ranges(ranges)
+    window_starts = np.array([start for start, _ in windows])
+    # Ranges are sorted, so each window holds a contiguous run of them
+    owner = np.searchsorted(window_starts, [start for start, _ in ranges], side="right") - 1
+    members = [np.flatnonzero(owner == w).tolist() for w in range(len(windows))]
+
+    graph = []
+    for stream in streams:
+        trim, prefix = ("trim", "") if stream == "v" else ("atrim", "a")
+        for w, (window_start, _) in enumerate(windows):
+            graph.append(f"[{w}:{stream}]{prefix}split={len(members[w])}" + "".join(f"[{stream}in{i}]" for i in members[w]))
+            for i in members[w]:
+                start, end = ranges[i][0] - window_start, ranges[i][1] - window_start
+                labels = "".join(f"[{stream}{i}_{k}]" for k in users[i])
+                graph.append(f"[{stream}in{i}]{trim}=start={start:.6f}:end={end:.6f},{prefix}setpts=PTS-STARTPTS,{prefix}split={len(users[i])}{labels}")
+
+    for k, output_ranges in enumerate(per_output):
+        pieces = [index[r] for r in output_ranges]
+        inputs = "".join(f"[{stream}{i}_{k}]" for i in pieces for stream in streams)
+        graph.append(f"{inputs}concat=n={len(pieces)}:v=1:a={len(streams) - 1}" + "".join(f"[{stream}out{k}]" for stream in streams))
+
+    return ";".join(graph), windows
+
+
+def plan_smart_cut(timestamps: Sequence[Sequence[float]], keyframes: np.ndarray) -> List[Tuple[float, float, bool]]:
+    """
+    Splits each range at the first and last keyframe inside it.
+
+    Returns:
+        (start, end, copy) pieces in order: the keyframe-to-keyframe middle of a range is stream-copied,
+        the partial GOPs before and after it are re-encoded. Ranges holding fewer than two keyframes
+        are re-encoded whole.
+    """
+
+    pieces = []
+    for start, end in timestamps:
+        inside = keyframes[(keyframes >= start) & (keyframes <= end)]
+        if len(inside) < 2:
+            # No complete GOP to copy, so the whole range is re-encoded
+            pieces.append((start, end, False))
+            continue
+        first, last = float(inside[0]), float(inside[-1])
+        if start < first:
+            pieces.append((start, first, False))
+        pieces.append((first, last, True))
+        if last < end:
+            pieces.append((last, end, False))
+    return pieces
 
 
 class Splicer:
@@ -11,16 +124,29 @@ class Splicer:
     def __init__(self, config: dict):
         self.config = config
 
-    def splice(self, video_path: str, timestamps: List[Tuple[float, float]], output_path: str):
+    def normalize(self, timestamps: Sequence[Sequence[float]]) -> List[Tuple[float, float]]:
+        """Coalesces the ranges with the configured gap_tolerance and min_duration, reporting the concat entries saved."""
+
+        ranges = coalesce_ranges(timestamps, self.config.get("gap_tolerance", 0.0), self.config.get("min_duration", 0.0))
+        print(f"Coalesced {len(timestamps)} ranges into {len(ranges)}, saving {len(timestamps) - len(ranges)} concat entries")
+        return ranges
+
+    def splice(self, video_path: str, timestamps: List[Tuple[float, float]], output_path: str) -> bool:
         """Splices a video using FFmpeg based on a list of timestamps."""
 
         print("Splicing video")
 
-        concat_list_file = "concat_list.txt"
+        mode = self.config.get("mode", "copy")
+        if mode == "smart":
+            return self._smart_splice(video_path, timestamps, output_path)
+        assert mode == "copy", f"Unknown splice mode: {mode}"
 
-        with open(concat_list_file, "w") as f:
+        # Each job gets its own list, so concurrent splices never overwrite each other's
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", prefix="concat_", dir=output_dir, delete=False) as f:
+            concat_list_file = f.name
             for start, end in timestamps:
-                f.write(f"file '{video_path}'\n")
+                f.write(f"file '{os.path.abspath(video_path)}'\n")
                 f.write(f"inpoint {start}\n")
                 f.write(f"outpoint {end}\n")
 
@@ -29,8 +155,190 @@ class Splicer:
             "-c", "copy", output_path
         ]
         try:
-            subprocess.run(command, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error splicing video: {e}")
-        os.remove(concat_list_file)
-        print(f"Spliced video saved to {output_path}")
+            return self._run(command, output_path)
+        finally:
+            os.remove(concat_list_file)
+
+    def splice_many(self, jobs: List[Tuple[str, List[Tuple[float, float]], str]]) -> List[bool]:
+        """
+        Runs several (video_path, timestamps, output_path) splices at once, at most workers ffmpeg
+        processes at a time. Output is captured per job so logs of concurrent jobs don't interleave.
+
+        Returns:
+            Whether each job succeeded, in the order given.
+        """
+
+        workers = max(1, min(len(jobs), self.config.get("workers", os.cpu_count() or 1)))
+        print(f"Splicing {len(jobs)} videos with {workers} workers")
+
+        # Threads only wait on ffmpeg, the work itself happens in the ffmpeg processes
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda job: self.splice(*job), jobs))
+
+    def splice_multi(self, video_path: str, outputs: List[Tuple[List[Tuple[float, float]], str]]) -> bool:
+        """
+        Cuts several summaries of one video, e.g. 30s, 60s and 3 minute versions, in a single ffmpeg run.
+
+        Each window of the source holding ranges is seeked to and decoded once. Every distinct range is
+        trimmed once and split between the outputs that use it, then each output concatenates its ranges. Unlike splice this re-encodes, with
+        video_codec / audio_codec from the config.
+
+        Args:
+            video_path: The source video.
+            outputs: (timestamps, output_path) per summary.
+        """
+
+        print(f"Splicing {len(outputs)} outputs from one decode")
+        command = self._multi_splice_command(video_path, outputs, self._has_audio(video_path))
+        return self._run(command, outputs[0][1])
+
+    def _multi_splice_command(self, video_path: str, outputs: List[Tuple[List[Tuple[float, float]], str]], audio: bool) -> List[str]:
+        """Builds the ffmpeg command of splice_multi, with one seeked and bounded input per window of ranges."""
+
+        graph, windows = multi_splice_graph([timestamps for timestamps, _ in outputs], audio)
+
+        command = ["ffmpeg"]
+        for start, end in windows:
+            command += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", video_path]
+        command += ["-filter_complex", graph]
+
+        for k, (_, output_path) in enumerate(outputs):
+            command += ["-map", f"[vout{k}]", "-c:v", self.config.get("video_codec", "libx264")]
+            if audio:
+                command += ["-map", f"[aout{k}]", "-c:a", self.config.get("audio_codec", "aac")]
+            command.append(output_path)
+        return command
+
+    def _smart_splice(self, video_path: str, timestamps: List[Tuple[float, float]], output_path: str) -> bool:
+        """
+        Frame-accurate splicing at close to stream-copy speed.
+
+        Each range is split at the first and last keyframe inside it. Only the partial GOPs before
+        the first and after the last keyframe are re-encoded, with the source's codec, profile, pixel
+        format, time base and audio layout, everything between them is stream-copied. The pieces are
+        then joined with the concat demuxer. Sources whose codecs cannot be matched are re-encoded whole.
+
+        Copied pieces start at a keyframe, so open-GOP sources (e.g. x265 defaults) lose the leading
+        pictures that reference the GOP before it.
+        """
+
+        keyframes = self._keyframe_times(video_path)
+        streams = self._stream_info(video_path)
+        if keyframes is None or streams is None:
+            print(f"Error splicing video {output_path}, could not probe {video_path}")
+            return False
+
+        encode = self._matching_encoder_args(streams)
+        if encode is None:
+            print("Smart cut: cannot encode to match the source codecs, re-encoding the whole summary")
+            return self.splice_multi(video_path, [(timestamps, output_path)])
+
+        pieces = plan_smart_cut(timestamps, keyframes)
+        copied = sum(end - start for start, end, copy in pieces if copy)
+        total = sum(end - start for start, end in timestamps)
+        print(f"Smart cut: {len(pieces)} pieces, {copied:.1f}s of {total:.1f}s stream-copied")
+
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        with tempfile.TemporaryDirectory(prefix="smartcut_", dir=output_dir) as work_dir:
+            paths = []
+            for i, (start, end, copy) in enumerate(pieces):
+                path = os.path.join(work_dir, f"piece_{i:05d}.mp4")
+                command = ["ffmpeg", "-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}"]
+                command += ["-c", "copy"] if copy else encode
+                if not self._run(command + ["-avoid_negative_ts", "make_zero", path], path, announce=False):
+                    return False
+                paths.append(path)
+
+            concat_list_file = os.path.join(work_dir, "concat_list.txt")
+            with open(concat_list_file, "w") as f:
+                for path in paths:
+                    f.write(f"file '{path}'\n")
+
+            command = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_file, "-c", "copy", output_path]
+            return self._run(command, output_path)
+
+    @staticmethod
+    def _matching_encoder_args(streams: Dict[str, Dict[str, Any]]) -> Optional[List[str]]:
+        """
+        Encoder options that reproduce the source's first video and audio stream parameters, or None if
+        a codec or profile has no matching encoder. Frames keep the source size since nothing scales them.
+        """
+
+        video = streams.get("video")
+        if video is None or video.get("codec_name") not in VIDEO_ENCODERS:
+            return None
+        encoder = VIDEO_ENCODERS[video["codec_name"]]
+        args = ["-c:v", encoder, "-pix_fmt", video["pix_fmt"]]
+
+        profiles = ENCODER_PROFILES.get(encoder)
+        if profiles is not None:
+            if video.get("profile") not in profiles:
+                return None
+            args += ["-profile:v", profiles[video["profile"]]]
+        if encoder == "libx264" and video.get("level", 0) > 0:
+            args += ["-level:v", f"{video['level'] / 10:.1f}"]
+        # The MP4 timescale of the copied pieces is the source time base
+        args += ["-video_track_timescale", video["time_base"].split("/")[1]]
+
+        audio = streams.get("audio")
+        if audio is not None:
+            if audio.get("codec_name") not in AUDIO_ENCODERS:
+                return None
+            encoder = AUDIO_ENCODERS[audio["codec_name"]]
+            profiles = ENCODER_PROFILES.get(encoder)
+            if profiles is not None and audio.get("profile") not in profiles:
+                return None
+            args += ["-c:a", encoder, "-ar", str(audio["sample_rate"]), "-ac", str(audio["channels"])]
+            if profiles is not None:
+                args += ["-profile:a", profiles[audio["profile"]]]
+        return args
+
+    def _stream_info(self, video_path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Codec parameters of the first video and audio stream by codec_type, read with ffprobe, or None if it fails."""
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries",
+             "stream=codec_type,codec_name,profile,level,pix_fmt,width,height,time_base,sample_rate,channels",
+             "-of", "json", video_path],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        streams = {}
+        for stream in json.loads(result.stdout).get("streams", []):
+            streams.setdefault(stream.get("codec_type"), stream)
+        return streams
+
+    def _keyframe_times(self, video_path: str) -> Optional[np.ndarray]:
+        """Reads the presentation times of the video's keyframes with ffprobe without decoding, or None if it fails."""
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        times = [float(line.split(",")[0]) for line in result.stdout.splitlines() if "K" in line.split(",", 1)[-1] and not line.startswith("N/A")]
+        return np.array(sorted(times))
+
+    def _has_audio(self, video_path: str) -> bool:
+        """Checks with ffprobe whether the video has an audio stream."""
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", video_path],
+            capture_output=True, text=True
+        )
+        return bool(result.stdout.strip())
+
+    def _run(self, command: List[str], output_path: str, announce: bool = True) -> bool:
+        """Runs ffmpeg with its output captured. On failure the log is printed and kept next to the output."""
+
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        if result.returncode != 0:
+            log_path = os.path.splitext(output_path)[0] + ".ffmpeg.log"
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write(result.stderr)
+            tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+            print(f"Error splicing video {output_path}, ffmpeg exited with {result.returncode} (log: {log_path}):\n{tail}")
+            return False
+
+        if announce:
+            print(f"Spliced video saved to {output_path}")
+        return True
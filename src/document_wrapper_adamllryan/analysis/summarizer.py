@@ -76,6 +76,30 @@ class Summarizer:
 
         return summary
 
+    def summarize_ranked(self, sentences: List[str], scores: List[float], top_k: Optional[int] = None, token_budget: Optional[int] = None) -> str:
+        """Summarizes only the highest scoring sentences that fit within a token budget."""
+
+        if token_budget is None:
+            token_budget = 2 * self.token_limit
+
+        order = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+        if top_k is not None:
+            order = order[:top_k]
+
+        selected = []
+        used = 0
+        for i in order:
+            tokens = self._count_tokens(sentences[i])
+            if used + tokens > token_budget:
+                continue
+            selected.append(i)
+            used += tokens
+
+        print(f"Summarizing {len(selected)} of {len(sentences)} sentences ({used} tokens)")
+
+        # Keep the transcript order so the model still reads a coherent text
+        return self.summarize("\n".join(sentences[i] for i in sorted(selected)))
+
     def _generate_summary(self, text: Union[list[str], str]) -> str:
         """Generates a summary for a given text chunk."""
         if isinstance(text, str):
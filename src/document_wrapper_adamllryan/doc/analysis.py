@@ -1,4 +1,5 @@
-from typing import List, Dict, Any, Callable
+from typing import List, Dict, Any, Callable, Optional, Sequence
+import numpy as np
 from .document import Document
 from .track import TextTrack, KeyframeTrack
 
@@ -106,4 +107,32 @@ class DocumentAnalysis:
                         "keyframe": KeyframeTrack,
                         }, metadata)
 
-
+    @staticmethod
+    def event_histogram(document: Document, timestamps: Sequence[float], weights: Optional[Sequence[float]] = None) -> np.ndarray:
+        """
+        Bins timestamped events (keyframes, scene cuts, audio peaks...) into the sentences containing them.
+
+        Sentences are assumed to be sorted by time. An event on the boundary of two sentences goes to the
+        earlier one, and events outside every sentence are dropped, matching Sentence.contains.
+
+        Args:
+            document: The document whose sentences are the bins.
+            timestamps: Event times in seconds.
+            weights: Optional weight per event, each event counts as 1 otherwise.
+
+        Returns:
+            One event count, or summed weight, per sentence.
+        """
+
+        starts = np.array([sentence.start for sentence in document.sentences], dtype=np.float64)
+        ends = np.array([sentence.end for sentence in document.sentences], dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+
+        # First sentence ending at or after each event, which holds it if it has also started
+        indices = np.searchsorted(ends, timestamps, side="left")
+        inside = indices < len(ends)
+        inside[inside] = starts[indices[inside]] <= timestamps[inside]
+
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[inside]
+        return np.bincount(indices[inside], weights=weights, minlength=len(ends))
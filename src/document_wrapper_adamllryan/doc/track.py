@@ -45,10 +45,12 @@ class TextTrack(Track):
             self.text = ""
             self.speaker = "UNKNOWN"
             self.embeddings = {}
+            self.query_scores = {}
         else:
             self.text = data.get("text", "")
             self.speaker = data.get("speaker", "UNKNOWN")
             self.embeddings = data.get("embeddings", {})
+            self.query_scores = data.get("query_scores", {})
 
 
     def set_text(self, text: str) -> None:
@@ -74,10 +76,11 @@ class TextTrack(Track):
         self.text = data.get("text", "")
         self.speaker = data.get("speaker", "UNKNOWN")
         self.embeddings = data.get("embeddings", {})
+        self.query_scores = data.get("query_scores", {})
         self.score = data.get("score", None)
 
     def get_data(self) -> Dict[str, str]:
-        return {"text": self.text, "speaker": self.speaker, "embeddings": self.embeddings, "score": self.score}
+        return {"text": self.text, "speaker": self.speaker, "embeddings": self.embeddings, "query_scores": self.query_scores, "score": self.score}
 
     def get_formatted_text(self) -> str:
         return f"{self.speaker}: {self.text}"
@@ -91,6 +94,12 @@ class TextTrack(Track):
     def get_embeddings(self) -> Dict[str, Any]:
         return self.embeddings 
 
+    def add_query_scores(self, query_scores: Dict[str, float]) -> None:
+        self.query_scores.update(query_scores)
+
+    def get_query_scores(self) -> Dict[str, float]:
+        return self.query_scores
+
 class KeyframeTrack(Track):
     """
     Represents a keyframe track in a video.
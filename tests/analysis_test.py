@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from document_wrapper_adamllryan.doc.document import Document
 from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
 
@@ -707,5 +708,40 @@ class TestDocumentAnalysis(unittest.TestCase):
         self.assertEqual(document.sentences[0].start, 0.0)
         self.assertEqual(document.sentences[1].end, 210.02)
 
+class TestEventHistogram(unittest.TestCase):
+    def setUp(self):
+        """Initialize a document with a gap between its second and third sentence."""
+        self.document = DocumentAnalysis.list_to_document_from_processed([
+            {"start": 0.0, "end": 2.0, "text": {"text": "One."}},
+            {"start": 2.0, "end": 4.0, "text": {"text": "Two."}},
+            {"start": 5.0, "end": 6.0, "text": {"text": "Three."}},
+        ])
+
+    def test_counts_events(self):
+        """Test that events are counted in the sentence containing them."""
+        counts = DocumentAnalysis.event_histogram(self.document, [0.5, 1.0, 3.0, 5.5])
+        self.assertEqual(counts.tolist(), [2, 1, 1])
+
+    def test_boundaries_and_gaps(self):
+        """Test that boundary events go to the earlier sentence and events in gaps are dropped."""
+        counts = DocumentAnalysis.event_histogram(self.document, [2.0, 4.5, 6.0, 7.0, -1.0])
+        self.assertEqual(counts.tolist(), [1, 0, 1])
+
+    def test_weights(self):
+        """Test that weights are summed per sentence."""
+        sums = DocumentAnalysis.event_histogram(self.document, [0.5, 1.5, 5.0], weights=[0.25, 0.5, 2.0])
+        np.testing.assert_allclose(sums, [0.75, 0.0, 2.0])
+
+    def test_matches_contains(self):
+        """Test that the histogram agrees with scanning Sentence.contains."""
+        timestamps = np.random.default_rng(0).uniform(-1, 7, 200)
+        expected = [0] * len(self.document.sentences)
+        for ts in timestamps:
+            for i, sentence in enumerate(self.document.sentences):
+                if sentence.contains(ts):
+                    expected[i] += 1
+                    break
+        self.assertEqual(DocumentAnalysis.event_histogram(self.document, timestamps).tolist(), expected)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+import numpy as np
+from document_wrapper_adamllryan.analysis.embedding_cache import EmbeddingCache
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        """Initialize an empty cache in a temporary directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(self.directory.name, "test/model", dim=3, max_entries=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup_hits_and_misses(self):
+        """Test that stored texts are returned and unknown texts are reported missing."""
+        self.cache.store(["Hello there."], np.array([[1.0, 2.0, 3.0]]))
+        embeddings, missing = self.cache.lookup(["Hello   there.", "Goodbye."])
+
+        np.testing.assert_array_equal(embeddings[0], [1.0, 2.0, 3.0])
+        self.assertEqual(missing, [1])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the oldest untouched entry is evicted when the cache is full."""
+        self.cache.store(["a", "b"], np.eye(3)[:2])
+        self.cache.lookup(["a"])
+        self.cache.store(["c"], np.eye(3)[2:])
+
+        _, missing = self.cache.lookup(["a", "b", "c"])
+        self.assertEqual(missing, [1])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_persistence(self):
+        """Test that flushed entries survive reopening the cache."""
+        self.cache.store(["a"], np.array([[0.5, 0.5, 0.5]]))
+        self.cache.flush()
+
+        reopened = EmbeddingCache(self.directory.name, "test/model", dim=3, max_entries=2)
+        embeddings, missing = reopened.lookup(["a"])
+        self.assertEqual(missing, [])
+        np.testing.assert_array_equal(embeddings[0], [0.5, 0.5, 0.5])
+
+    def test_hits_mark_recency_for_flushing(self):
+        """Test that an all-hit lookup marks the cache dirty and its recency survives reopening."""
+        self.cache.store(["a", "b"], np.eye(3)[:2])
+        self.cache.flush()
+        self.assertFalse(self.cache.dirty)
+
+        self.cache.lookup(["a"])
+        self.assertTrue(self.cache.dirty)
+        self.cache.flush()
+
+        reopened = EmbeddingCache(self.directory.name, "test/model", dim=3, max_entries=2)
+        reopened.store(["c"], np.eye(3)[2:])
+        _, missing = reopened.lookup(["a", "b", "c"])
+        self.assertEqual(missing, [1])
+
+if __name__ == "__main__":
+    unittest.main()
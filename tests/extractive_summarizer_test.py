@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
+from document_wrapper_adamllryan.analysis.extractive_summarizer import ExtractiveSummarizer
+
+class TestExtractiveSummarizer(unittest.TestCase):
+    def setUp(self):
+        """Initialize a document with a blank gap sentence and matching embeddings."""
+        self.document = DocumentAnalysis.list_to_document_from_segments([
+            {"text": "Cats are small animals.", "start": 0.0, "end": 1.0},
+            {"text": "Dogs are loyal animals.", "start": 2.0, "end": 3.0},
+            {"text": "Stocks fell sharply today.", "start": 3.0, "end": 4.0},
+        ])
+        self.embeddings = np.array([
+            [1.0, 0.1, 0.0],
+            [0.0, 0.0, 0.0],  # Blank gap sentence
+            [0.9, 0.2, 0.0],
+            [0.0, 0.1, 1.0],
+        ])
+
+    def test_blank_sentences_are_skipped(self):
+        """Test that gap sentences never end up in the summary."""
+        summarizer = ExtractiveSummarizer({"method": "centroid", "num_sentences": 3})
+        summary = summarizer.summarize(self.document, self.embeddings)
+        self.assertEqual(summary, "Cats are small animals. Dogs are loyal animals. Stocks fell sharply today.")
+
+    def test_central_sentences_are_selected(self):
+        """Test that both methods prefer the sentences that agree with each other."""
+        for method in ("textrank", "centroid"):
+            summarizer = ExtractiveSummarizer({"method": method, "num_sentences": 2})
+            summary = summarizer.summarize(self.document, self.embeddings)
+            self.assertEqual(summary, "Cats are small animals. Dogs are loyal animals.")
+
+    def test_textrank_scores_sum_to_one(self):
+        """Test that TextRank returns a probability distribution."""
+        summarizer = ExtractiveSummarizer({"method": "textrank"})
+        ranks = summarizer.rank(self.embeddings[[0, 2, 3]])
+        self.assertAlmostEqual(float(ranks.sum()), 1.0, places=5)
+
+    def test_keyword_scores_prefer_recurring_words(self):
+        """Test that sentences built from recurring keywords score higher."""
+        scores = ExtractiveSummarizer.keyword_scores([
+            "Encryption keeps messages private.",
+            "Encryption relies on keys.",
+            "The weather was nice.",
+            "",
+        ])
+        self.assertEqual(len(scores), 4)
+        self.assertGreater(scores[0], scores[2])
+        self.assertEqual(scores[3], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+from document_wrapper_adamllryan.analysis.filter import Filter, ScoreRanking
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
+
+def make_document(text_scores, keyframe_scores, timestamps=None):
+    """Build a processed document with the given track scores, one second per sentence by default."""
+    timestamps = timestamps or [(float(i), float(i + 1)) for i in range(len(text_scores))]
+    return DocumentAnalysis.list_to_document_from_processed([
+        {"start": start, "end": end, "text": {"text": f"Sentence {i}.", "score": t}, "keyframe": {"score": k}}
+        for i, ((start, end), t, k) in enumerate(zip(timestamps, text_scores, keyframe_scores))
+    ])
+
+class TestFilter(unittest.TestCase):
+    def test_combine_normalizes_keyframes(self):
+        """Test that keyframe scores are min-max normalized and added to the raw text scores."""
+        document = make_document([0.5, 0.2, 0.1], [0, 5, 10])
+        np.testing.assert_allclose(Filter({}).combine(document), [0.5, 0.7, 1.1])
+
+    def test_constant_keyframe_scores(self):
+        """Test that constant keyframe scores become 1 when all zero and 0 otherwise."""
+        np.testing.assert_allclose(Filter({}).combine(make_document([0.0, 0.0], [0, 0])), [1.0, 1.0])
+        np.testing.assert_allclose(Filter({}).combine(make_document([0.0, 0.0], [3, 3])), [0.0, 0.0])
+
+    def test_weights_and_missing_scores(self):
+        """Test that per-track weights apply and missing scores count as 0."""
+        document = make_document([0.5, None, 0.1], [0, 5, 10])
+        config = {"weights": {"text": 2.0, "keyframe": 0.5}}
+        np.testing.assert_allclose(Filter(config).combine(document), [1.0, 0.25, 0.7])
+
+    def test_apply_keeps_duplicate_timestamps(self):
+        """Test that sentences sharing a timestamp are scored and selected separately."""
+        document = make_document([0.1, 0.9, 0.8], [0, 0, 0], [(0.0, 1.0), (1.0, 2.0), (1.0, 2.0)])
+        Filter({"threshold_percentile": 50, "weights": {"text": 1.0}}).apply(document)
+
+        self.assertEqual(document.metadata["filtered_sentences"], [(1.0, 2.0), (1.0, 2.0)])
+        self.assertEqual([s.get_score() for s in document.sentences], [0.1, 0.9, 0.8])
+
+    def test_duration_budget_knapsack(self):
+        """Test that the exact selection finds the best set that fits the target duration."""
+        # The densest sentence (2) would block the better pair (0, 1) under greedy selection
+        document = make_document([0.6, 0.6, 0.95], [0, 0, 0], [(0.0, 2.0), (2.0, 4.0), (4.0, 7.0)])
+        Filter({"selection": "duration", "target_duration": 4.0, "weights": {"text": 1.0}}).apply(document)
+        self.assertEqual(document.metadata["filtered_sentences"], [(0.0, 2.0), (2.0, 4.0)])
+
+    def test_duration_budget_greedy(self):
+        """Test that greedy selection stays within a compression ratio of the total duration."""
+        rng = np.random.default_rng(0)
+        starts = np.cumsum(rng.uniform(0.5, 5.0, 300))
+        timestamps = [(float(s), float(s + d)) for s, d in zip(starts, rng.uniform(0.5, 5.0, 300))]
+        document = make_document(rng.uniform(0, 1, 300).tolist(), [0] * 300, timestamps)
+
+        Filter({"selection": "duration", "compression_ratio": 0.25, "knapsack_max_n": 0, "weights": {"text": 1.0}}).apply(document)
+        selected = document.metadata["filtered_sentences"]
+        total = sum(end - start for start, end in timestamps)
+        self.assertLessEqual(sum(end - start for start, end in selected), 0.25 * total + 1e-9)
+        self.assertGreater(sum(end - start for start, end in selected), 0.2 * total)
+
+class TestScoreRanking(unittest.TestCase):
+    def setUp(self):
+        """Initialize a document with random scores and durations."""
+        rng = np.random.default_rng(1)
+        starts = np.cumsum(rng.uniform(0.5, 3.0, 50))
+        self.timestamps = [(float(s), float(s + d)) for s, d in zip(starts, rng.uniform(0.5, 3.0, 50))]
+        self.text_scores = np.round(rng.uniform(0, 1, 50), 1).tolist()  # Rounded so some scores tie
+        self.config = {"weights": {"text": 1.0}}
+
+    def test_select_matches_apply(self):
+        """Test that ranked selections match filtering at each percentile."""
+        ranking = Filter(self.config).rank(make_document(self.text_scores, [0] * 50, self.timestamps))
+        for percentile in (0, 25, 50, 80, 100):
+            document = make_document(self.text_scores, [0] * 50, self.timestamps)
+            Filter({**self.config, "threshold_percentile": percentile}).apply(document)
+            self.assertEqual(ranking.select(percentile), document.metadata["filtered_sentences"])
+
+    def test_sweep(self):
+        """Test that a sweep returns the selection and its duration for every percentile."""
+        document = make_document(self.text_scores, [0] * 50, self.timestamps)
+        Filter(self.config).apply(document)
+        ranking = ScoreRanking.from_document(document)
+
+        percentiles = [10, 50, 90]
+        selections = ranking.sweep(percentiles)
+        durations = ranking.sweep(percentiles, durations_only=True)
+        for percentile, selection, duration in zip(percentiles, selections, durations):
+            self.assertEqual(selection, ranking.select(percentile))
+            self.assertAlmostEqual(duration, sum(end - start for start, end in selection))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Compares keyframe feature extractors and clustering backends on one video.
+
+Frames are sampled once, then every (features, clustering) combination is timed, its peak
+Python memory is measured and its selected timestamps are compared with the default
+raw pixels + KMeans path. Finally the clustering and scene change scorers are timed end to end,
+the scene change scorer with frames from the sampler, decoded to grayscale by ffmpeg and
+decoded from keyframes only, and their speedup over clustering is reported. Use a realistic resolution (e.g. 1080p) video,
+decoding dominates at full resolution.
+
+Usage: python tests/keyframe_benchmark.py path/to/video.mp4 [n_clusters] [skip_frames]
+"""
+import sys
+import time
+import tracemalloc
+from document_wrapper_adamllryan.analysis.keyframe_extractor import KeyframeExtractor
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
+
+BASE_CONFIG = {"sampling": "grab", "skip_frames": 60, "crop_size": (50, 50)}
+
+COMBINATIONS = [
+    ("raw", "kmeans"),
+    ("raw", "minibatch"),
+    ("hsv_histogram", "kmeans"),
+    ("hsv_histogram", "minibatch"),
+    ("grayscale", "kmeans"),
+    ("grayscale", "minibatch"),
+    ("pca", "kmeans"),
+    ("pca", "minibatch"),
+]
+
+def run(video_path: str, n_clusters: int = 5, skip_frames: int = 60):
+    BASE_CONFIG["skip_frames"] = skip_frames
+    sampler = KeyframeExtractor(BASE_CONFIG)
+    rng = sampler._video_rng(video_path)
+    frames, timestamps = sampler._collect_crops(sampler._crop_blocks(sampler._sample_frames(video_path), lambda n: rng.random((n, 2))))
+    print(f"Sampled {len(frames)} frames from {video_path}\n")
+
+    baseline = None
+    print(f"{'features':<15}{'clustering':<12}{'time (s)':>10}{'peak (MB)':>11}{'overlap':>9}")
+    for features, clustering in COMBINATIONS:
+        extractor = KeyframeExtractor({**BASE_CONFIG, "features": features, "clustering": clustering})
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        selected = extractor._cluster_keyframes(frames, timestamps, n_clusters)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+        selected_timestamps = {kf["timestamp"] for kf in selected}
+        if baseline is None:
+            baseline = selected_timestamps
+        overlap = len(selected_timestamps & baseline) / max(len(selected_timestamps | baseline), 1)
+
+        print(f"{features:<15}{clustering:<12}{elapsed:>10.3f}{peak:>11.1f}{overlap:>9.2f}")
+
+    # End to end, including decoding, against the scene change scorer
+    document = DocumentAnalysis.list_to_document_from_processed([{"start": 0.0, "end": float(timestamps[-1]) + 1.0, "text": {"text": ""}}])
+    scorers = [
+        ("clusters", {"scorer": "clusters"}),
+        ("scene_change (sampler)", {"scorer": "scene_change", "scene_decoder": "sampler"}),
+        ("scene_change (ffmpeg)", {"scorer": "scene_change", "scene_decoder": "ffmpeg"}),
+        ("scene_change (keyframes)", {"scorer": "scene_change", "scene_decoder": "ffmpeg", "keyframes_only": True}),
+    ]
+    results = []
+    for name, settings in scorers:
+        extractor = KeyframeExtractor({**BASE_CONFIG, **settings, "n_clusters": n_clusters})
+        start = time.perf_counter()
+        extractor.extract(video_path, document)
+        results.append((name, time.perf_counter() - start))
+
+    print(f"\n{'scorer':<27}{'time (s)':>10}{'speedup':>9}")
+    for name, elapsed in results:
+        print(f"{name:<27}{elapsed:>10.3f}{results[0][1] / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 5, int(sys.argv[3]) if len(sys.argv) > 3 else 60)
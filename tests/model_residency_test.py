@@ -0,0 +1,123 @@
+import threading
+import unittest
+from unittest import mock
+from document_wrapper_adamllryan.analysis import model_residency
+from document_wrapper_adamllryan.analysis.model_residency import ModelResidency
+
+class TestModelResidency(unittest.TestCase):
+    def setUp(self):
+        """Fake the process memory so each loader adds its model's size to it."""
+        self.memory = 0.0
+        self.loads = []
+        patcher = mock.patch.object(model_residency, "current_memory_mb", lambda: self.memory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def loader(self, name, size):
+        def load():
+            self.memory += size
+            self.loads.append(name)
+            return name
+        return load
+
+    def test_models_stay_loaded_within_budget(self):
+        """Test that models that fit the budget are loaded once and reused."""
+        residency = ModelResidency({"memory_budget_mb": 300})
+        for _ in range(3):
+            for name in ("a", "b"):
+                with residency.use(name, self.loader(name, 100)) as model:
+                    self.assertEqual(model, name)
+
+        self.assertEqual(self.loads, ["a", "b"])
+        self.assertEqual(residency.resident_mb(), 200)
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the least recently used model makes room for a new one."""
+        residency = ModelResidency({"memory_budget_mb": 250})
+        for name in ("a", "b", "a", "c"):
+            with residency.use(name, self.loader(name, 100)):
+                pass
+
+        self.assertEqual(list(residency.models), ["a", "c"])
+        self.assertEqual(self.loads, ["a", "b", "c"])
+
+    def test_known_footprint_evicts_before_loading(self):
+        """Test that a reloaded model's remembered size is freed before its loader runs."""
+        residency = ModelResidency({"memory_budget_mb": 150})
+        for name in ("a", "b"):
+            with residency.use(name, self.loader(name, 100)):
+                pass
+
+        resident_during_load = []
+        def reload():
+            resident_during_load.extend(residency.models)
+            return self.loader("a", 100)()
+        with residency.use("a", reload):
+            pass
+        self.assertEqual(resident_during_load, [])
+
+    def test_models_in_use_are_not_evicted(self):
+        """Test that a model being used survives loading another over the budget."""
+        residency = ModelResidency({"memory_budget_mb": 0})
+        with residency.use("a", self.loader("a", 100)):
+            with residency.use("b", self.loader("b", 100)):
+                self.assertEqual(list(residency.models), ["a", "b"])
+            with residency.use("c", self.loader("c", 100)):
+                self.assertEqual(list(residency.models), ["a", "c"])
+
+        residency.clear()
+        self.assertEqual(list(residency.models), [])
+
+    def test_unlimited_budget_keeps_alternating_models(self):
+        """Test that stages alternating per video load each model once without a budget."""
+        residency = ModelResidency({"memory_budget_mb": float("inf")})
+        for _ in range(3):
+            for name in ("transcriber", "summarizer", "scorer"):
+                with residency.use(name, self.loader(name, 1000)):
+                    pass
+        self.assertEqual(self.loads, ["transcriber", "summarizer", "scorer"])
+
+    def test_loading_does_not_block_resident_models(self):
+        """Test that a resident model can be borrowed while another model is loading."""
+        residency = ModelResidency({"memory_budget_mb": 1000})
+        with residency.use("a", self.loader("a", 100)):
+            pass
+
+        started, release = threading.Event(), threading.Event()
+        def slow_load():
+            started.set()
+            release.wait(5)
+            return "b"
+        loading = threading.Thread(target=lambda: residency.use("b", slow_load).__enter__())
+        loading.start()
+        started.wait(5)
+
+        borrowed = []
+        borrower = threading.Thread(target=lambda: borrowed.append(residency.use("a", self.loader("a", 100)).__enter__()))
+        borrower.start()
+        borrower.join(2)
+        self.assertEqual(borrowed, ["a"])
+
+        release.set()
+        loading.join(5)
+        self.assertEqual(list(residency.models), ["a", "b"])
+
+    def test_concurrent_borrowers_load_once(self):
+        """Test that threads borrowing the same missing model share one load."""
+        residency = ModelResidency({"memory_budget_mb": 1000})
+        barrier = threading.Barrier(4)
+        def borrow():
+            barrier.wait(5)
+            with residency.use("a", self.loader("a", 100)) as model:
+                self.assertEqual(model, "a")
+        threads = [threading.Thread(target=borrow) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.loads, ["a"])
+        self.assertEqual(residency.in_use["a"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+import numpy as np
+from document_wrapper_adamllryan.doc.analysis import DocumentAnalysis
+from document_wrapper_adamllryan.analysis.sentence_index import SentenceIndex
+
+def make_document(embeddings):
+    """Build a processed document with one sentence per embedding, two seconds each."""
+    return DocumentAnalysis.list_to_document_from_processed([
+        {"start": 2.0 * i, "end": 2.0 * i + 2.0, "text": {"text": f"Sentence {i}.", "embeddings": e}}
+        for i, e in enumerate(embeddings)
+    ])
+
+class TestSentenceIndex(unittest.TestCase):
+    def setUp(self):
+        """Initialize an index with two small videos."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = SentenceIndex(self.directory.name)
+        self.index.add_document("video_a", make_document([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], []]))
+        self.index.add_document("video_b", make_document([[0.0, 0.0, 1.0]]))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_search_returns_best_sentence(self):
+        """Test that the nearest sentence is returned with its video and time range."""
+        results = self.index.search(np.array([0.1, 0.9, 0.0]), k=2)
+        self.assertEqual(results[0][:3], ("video_a", 2.0, 4.0))
+        self.assertEqual(len(results), 2)
+
+    def test_sentences_without_embeddings_are_skipped(self):
+        """Test that blank sentences are not indexed."""
+        self.assertEqual(len(self.index), 3)
+
+    def test_re_adding_replaces_video(self):
+        """Test that adding a video again replaces its previous sentences."""
+        self.index.add_document("video_a", make_document([[0.0, 1.0, 0.0]]))
+        self.assertEqual(len(self.index), 2)
+        # The old first sentence of video_a would be the best match, video_b beats the new one
+        self.assertEqual(self.index.search(np.array([0.9, 0.0, 0.1]), k=1)[0][0], "video_b")
+
+    def test_reload_and_ivf_search(self):
+        """Test that a reopened index with IVF lists finds the same result."""
+        self.index.rebuild_ivf(n_lists=2)
+        reopened = SentenceIndex(self.directory.name, {"n_probe": 2})
+        self.assertEqual(len(reopened), 3)
+        self.assertIsNotNone(reopened.centroids)
+        self.assertEqual(reopened.search(np.array([0.0, 0.0, 1.0]), k=1)[0][0], "video_b")
+
+    def test_many_adds_grow_buffers(self):
+        """Test that appending past the buffer capacity keeps every row searchable."""
+        rng = np.random.default_rng(0)
+        for v in range(300):
+            self.index.add_document(f"video_{v}", make_document(rng.normal(size=(2, 3)).tolist()))
+        self.assertEqual(len(self.index), 603)
+
+        query = self.index.vectors[500]
+        video_id, start, _, score = self.index.search(query, k=1)[0]
+        self.assertEqual((video_id, start), (self.index.video_ids[self.index.owners[500]], self.index.starts[500]))
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_adds_after_ivf_build_survive_reload(self):
+        """Test that rows added after building the lists keep their assignments across a reload."""
+        self.index.rebuild_ivf(n_lists=2)
+        self.index.add_document("video_c", make_document([[0.0, 0.9, 0.1]]))
+        reopened = SentenceIndex(self.directory.name, {"n_probe": 2})
+        self.assertIsNotNone(reopened.centroids)
+        np.testing.assert_array_equal(reopened.assignments, self.index.assignments)
+
+    def test_lists_are_built_by_adds_not_searches(self):
+        """Test that crossing ivf_min_size builds the lists on add, while searching leaves the index alone."""
+        # Reopened already over the threshold, e.g. after the option was lowered
+        index = SentenceIndex(self.directory.name, {"ivf_min_size": 3})
+        index.search(np.array([1.0, 0.0, 0.0]), k=1)
+        self.assertIsNone(index.centroids)
+
+        index.add_document("video_c", make_document([[0.0, 1.0, 1.0], [1.0, 1.0, 0.0]]))
+        self.assertIsNotNone(index.centroids)
+        self.assertEqual(len(index.assignments), 5)
+
+    def test_empty_probed_lists(self):
+        """Test that a search whose probed lists are all empty returns nothing."""
+        self.index.rebuild_ivf(n_lists=3)
+        self.index.centroids = np.eye(3, dtype=np.float32)
+        self.index._assignments[:len(self.index)] = 0
+        self.index.n_probe = 1
+        self.assertEqual(self.index.search(np.array([0.0, 0.0, 1.0]), k=1), [])
+
+if __name__ == "__main__":
+    unittest.main()
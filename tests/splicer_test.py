@@ -0,0 +1,119 @@
+import re
+import unittest
+import numpy as np
+from document_wrapper_adamllryan.analysis.splicer import Splicer, coalesce_ranges, multi_splice_graph, plan_smart_cut
+
+def graph_labels(graph):
+    """Split a filter graph into the (inputs, outputs) link labels of each chain."""
+    chains = []
+    for chain in graph.split(";"):
+        inputs, _, outputs = re.fullmatch(r"((?:\[[^\]]+\])*)(.*?)((?:\[[^\]]+\])*)", chain).groups()
+        chains.append((re.findall(r"\[([^\]]+)\]", inputs), re.findall(r"\[([^\]]+)\]", outputs)))
+    return chains
+
+class TestCoalesceRanges(unittest.TestCase):
+    def test_merges_adjacent_and_overlapping(self):
+        """Test that touching and overlapping ranges merge, in sorted order."""
+        ranges = [(10.0, 12.0), (0.0, 2.0), (2.0, 4.0), (3.0, 3.5), (11.0, 15.0)]
+        self.assertEqual(coalesce_ranges(ranges), [(0.0, 4.0), (10.0, 15.0)])
+
+    def test_gap_tolerance(self):
+        """Test that ranges separated by at most the tolerance merge."""
+        ranges = [(0.0, 2.0), (2.3, 4.0), (5.0, 6.0)]
+        self.assertEqual(coalesce_ranges(ranges, gap_tolerance=0.5), [(0.0, 4.0), (5.0, 6.0)])
+        self.assertEqual(len(coalesce_ranges(ranges)), 3)
+
+    def test_min_duration(self):
+        """Test that short ranges are dropped after merging."""
+        ranges = [(0.0, 0.5), (0.5, 1.2), (5.0, 5.5)]
+        self.assertEqual(coalesce_ranges(ranges, min_duration=1.0), [(0.0, 1.2)])
+
+    def test_contained_range_does_not_shorten(self):
+        """Test that a range inside a longer one keeps the longer end."""
+        self.assertEqual(coalesce_ranges([(0.0, 10.0), (1.0, 2.0), (9.0, 11.0)]), [(0.0, 11.0)])
+
+    def test_empty(self):
+        self.assertEqual(coalesce_ranges([]), [])
+
+class TestMultiSpliceGraph(unittest.TestCase):
+    def assert_links_used_once(self, graph, n_outputs, audio):
+        """Every internal link is produced once and consumed once, the final outputs only produced."""
+        chains = graph_labels(graph)
+        produced = [label for _, outputs in chains for label in outputs]
+        consumed = [label for inputs, _ in chains for label in inputs if not re.match(r"\d+:", label)]
+        self.assertEqual(len(produced), len(set(produced)))
+        self.assertEqual(len(consumed), len(set(consumed)))
+        finals = {f"{stream}out{k}" for k in range(n_outputs) for stream in (["v", "a"] if audio else ["v"])}
+        self.assertEqual(set(produced) - set(consumed), finals)
+
+    def test_shared_ranges_are_trimmed_once(self):
+        """Test that a range used by two outputs is trimmed once and split between them."""
+        graph, windows = multi_splice_graph([[(0.0, 2.0), (5.0, 6.0)], [(5.0, 6.0)]], audio=True)
+        self.assertEqual(windows, [(0.0, 2.0), (5.0, 6.0)])
+        self.assertEqual(graph.count("atrim="), 2)
+        self.assertEqual(graph.count("trim=start=0.000000:end=1.000000"), 2)  # Once per stream
+        self.assertIn("[vin1]trim=start=0.000000:end=1.000000,setpts=PTS-STARTPTS,split=2[v1_0][v1_1]", graph)
+        self.assert_links_used_once(graph, 2, audio=True)
+
+    def test_repeated_ranges_are_used_once(self):
+        """Test that a range listed twice in one output only appears once in its concat."""
+        graph, _ = multi_splice_graph([[(1.0, 2.0), (1.0, 2.0), (4.0, 5.0)]], audio=False)
+        self.assertIn("[v0_0][v1_0]concat=n=2:v=1:a=0[vout0]", graph)
+        self.assertNotIn("atrim", graph)
+        self.assert_links_used_once(graph, 1, audio=False)
+
+    def test_overlapping_ranges_share_a_window(self):
+        """Test that ranges overlapping across outputs are trimmed relative to one window."""
+        graph, windows = multi_splice_graph([[(10.0, 12.0)], [(11.0, 14.0)], [(30.0, 31.0)]], audio=False)
+        self.assertEqual(windows, [(10.0, 14.0), (30.0, 31.0)])
+        self.assertIn("[0:v]split=2[vin0][vin1]", graph)
+        self.assertIn("[vin1]trim=start=1.000000:end=4.000000", graph)
+        self.assertIn("[1:v]split=1[vin2]", graph)
+        self.assert_links_used_once(graph, 3, audio=False)
+
+    def test_command_seeks_each_window(self):
+        """Test that every input is seeked to its window and bounded by its length."""
+        splicer = Splicer({})
+        command = splicer._multi_splice_command("in.mp4", [([(600.0, 602.0), (900.0, 901.5)], "a.mp4"), ([(600.5, 601.0)], "b.mp4")], audio=True)
+        first_input = command.index("-i")
+        self.assertEqual(command[1:first_input + 2], ["-ss", "600.000000", "-t", "2.000000", "-i", "in.mp4"])
+        self.assertEqual(command[first_input + 2:first_input + 8], ["-ss", "900.000000", "-t", "1.500000", "-i", "in.mp4"])
+        self.assertEqual(command.count("-i"), 2)
+        self.assertIn("[vin1]trim=start=0.500000:end=1.000000", command[command.index("-filter_complex") + 1])
+
+class TestSmartCut(unittest.TestCase):
+    def test_plan_copies_between_keyframes(self):
+        """Test that each range copies from its first to its last keyframe and re-encodes the edges."""
+        keyframes = np.array([0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+        pieces = plan_smart_cut([(1.0, 7.5), (8.0, 10.0)], keyframes)
+        self.assertEqual(pieces, [
+            (1.0, 2.0, False), (2.0, 6.0, True), (6.0, 7.5, False),
+            (8.0, 10.0, True),
+        ])
+
+    def test_plan_reencodes_ranges_without_a_gop(self):
+        """Test that a range holding fewer than two keyframes is re-encoded whole."""
+        keyframes = np.array([0.0, 5.0, 10.0])
+        self.assertEqual(plan_smart_cut([(1.0, 4.0), (4.5, 6.0)], keyframes), [(1.0, 4.0, False), (4.5, 6.0, False)])
+
+    def test_encoder_args_match_source(self):
+        """Test that boundary pieces are encoded with the source's codec parameters."""
+        streams = {
+            "video": {"codec_name": "h264", "profile": "Constrained Baseline", "level": 31, "pix_fmt": "yuv420p", "time_base": "1/15360"},
+            "audio": {"codec_name": "aac", "profile": "LC", "sample_rate": "48000", "channels": 2},
+        }
+        self.assertEqual(Splicer._matching_encoder_args(streams), [
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-profile:v", "baseline", "-level:v", "3.1",
+            "-video_track_timescale", "15360",
+            "-c:a", "aac", "-ar", "48000", "-ac", "2", "-profile:a", "aac_low",
+        ])
+
+    def test_unmatched_codecs(self):
+        """Test that codecs or profiles without a matching encoder give None."""
+        video = {"codec_name": "vp9", "profile": "Profile 0", "pix_fmt": "yuv420p", "time_base": "1/1000"}
+        self.assertIsNotNone(Splicer._matching_encoder_args({"video": video}))
+        self.assertIsNone(Splicer._matching_encoder_args({"video": {**video, "codec_name": "prores"}}))
+        self.assertIsNone(Splicer._matching_encoder_args({"video": video, "audio": {"codec_name": "aac", "profile": "HE-AAC"}}))
+
+if __name__ == "__main__":
+    unittest.main()